@@ -31,20 +31,26 @@ from typing import List, Tuple, Dict
 import os
 import logging
 import errno
+import contextlib
+import functools
 import math
 import time
-from glob import glob
 import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pickle
 
 # Third party imports
 import numpy as np
-from scipy.spatial import Delaunay, tsearch, cKDTree
+import scipy
+from scipy.spatial import Delaunay, cKDTree
 from tqdm import tqdm
 from json_checker import CheckerError
 import dask
 from osgeo import gdal, osr
 from shapely.geometry import Polygon
 import xarray as xr
+from numcodecs import Blosc
+from numba import njit, prange, float64, int64
 
 # Cars imports
 from cars import stereo
@@ -59,9 +65,113 @@ from cars import preprocessing
 from cars.cluster import start_local_cluster, start_cluster, stop_cluster, ComputeDSMMemoryLogger
 
 
+# cKDTree.query keyword to use all cpus, which was renamed from n_jobs to
+# workers in scipy 1.6
+if tuple(int(v) for v in scipy.__version__.split('.')[:2]) >= (1, 6):
+    KDTREE_QUERY_ALL_CPUS = {'workers': -1}
+else:
+    KDTREE_QUERY_ALL_CPUS = {'n_jobs': -1}
+
+class ConfigurationData:
+    """
+    Data gathered by compute_dsm for a stereo configuration
+    """
+    __slots__ = ('configuration', 'largest_epipolar_region', 'disp_min', 'disp_max',
+                 'origin', 'spacing', 'terrain_area', 'terrain_bounding_box',
+                 'opt_epipolar_tile_size', 'nb_epipolar_regions',
+                 'delayed_point_clouds_grid', 'epipolar_tiles_regions',
+                 'epipolar_tiles_empty')
+
+    def __init__(self, configuration):
+        """
+        Constructor, other attributes are set along compute_dsm.run
+
+        :param configuration: configuration values of the pair, as produced by prepare
+        :type configuration: dict
+        """
+        self.configuration = configuration
+        self.largest_epipolar_region = None
+        self.disp_min = None
+        self.disp_max = None
+        self.origin = None
+        self.spacing = None
+        self.terrain_area = None
+        self.terrain_bounding_box = None
+        self.opt_epipolar_tile_size = None
+        self.nb_epipolar_regions = None
+        self.delayed_point_clouds_grid = None
+        self.epipolar_tiles_regions = None
+        self.epipolar_tiles_empty = None
+
+
 def region_hash_string(region):
     '''This lambda will allow to derive a key to index region in the previous dictionnary'''
-    return "{}_{}_{}_{}".format(region[0],region[1],region[2],region[3])
+    return f"{region[0]}_{region[1]}_{region[2]}_{region[3]}"
+
+
+# Geoid read by a previous call to run(), indexed by its path
+_geoid_cache = {}
+
+
+def get_geoid_data():
+    '''
+    Read the geoid defined by the $OTB_GEOID_FILE environment variable, only
+    once for all the calls to run()
+
+    :return: the geoid height array in meter (see utils.read_geoid_file)
+    :rtype: xarray.Dataset
+    '''
+    geoid_path = os.environ['OTB_GEOID_FILE']
+    if geoid_path not in _geoid_cache:
+        _geoid_cache[geoid_path] = utils.read_geoid_file()
+    return _geoid_cache[geoid_path]
+
+
+# Pair configuration of the current multiprocessing worker, deserialized once
+# by _init_worker_configuration
+_worker_configuration = None
+
+
+def _init_worker_logging(log_file, log_level):
+    '''
+    Initializer of multiprocessing workers: workers started from a forkserver
+    do not inherit the logger of the main process, so set its level back and
+    append to the same log file
+
+    :param log_file: path of the compute_dsm log file
+    :param log_level: level of the main process logger
+    '''
+    logging.getLogger().setLevel(log_level)
+    utils.add_log_file_handler(log_file)
+
+
+def _init_worker_configuration(configuration_bytes, log_file, log_level):
+    '''
+    Initializer of multiprocessing workers: set up logging (see
+    _init_worker_logging) and deserialize the pair configuration once per
+    worker instead of once per task
+
+    :param configuration_bytes: pickled configuration values
+    :param log_file: path of the compute_dsm log file
+    :param log_level: level of the main process logger
+    '''
+    global _worker_configuration
+    _init_worker_logging(log_file, log_level)
+    _worker_configuration = pickle.loads(configuration_bytes)
+
+
+def _write_3d_points_in_worker(args):
+    '''
+    Call write_3d_points with the configuration of the current worker
+
+    :param args: tuple (region, corr_config, tmp_dir, config_id, kwargs),
+    see write_3d_points for details
+    :returns: the processed region along with the output of write_3d_points,
+    since results may be returned in any order
+    '''
+    region, corr_config, tmp_dir, config_id, kwargs = args
+    return region, write_3d_points(_worker_configuration, region, corr_config,
+                                   tmp_dir, config_id, **kwargs)
 
 
 def write_3d_points(configuration, region, corr_config, tmp_dir, config_id, **kwargs):
@@ -78,9 +188,7 @@ def write_3d_points(configuration, region, corr_config, tmp_dir, config_id, **kw
     config_id_dir = os.path.join(tmp_dir, config_id)
     hashed_region = region_hash_string(region)
     points_dir = os.path.join(config_id_dir, "points")
-    points_file = os.path.join(points_dir, "{}.nc".format(hashed_region))
     color_dir = os.path.join(config_id_dir, "color")
-    color_file = os.path.join(color_dir, "{}.nc".format(hashed_region))
     # Compute 3d points and colors
     points, colors = stereo.images_pair_to_3d_points(configuration, region, corr_config, **kwargs)
 
@@ -88,17 +196,20 @@ def write_3d_points(configuration, region, corr_config, tmp_dir, config_id, **kw
     utils.safe_makedirs(points_dir)
     utils.safe_makedirs(color_dir)
 
-    # Write to netcdf the 3d points and color, for both 'ref' and 'sec' modes
-    # output paths end with '_ref.nc' or '_sec.nc' 
+    # Write to zarr the 3d points and color, for both 'ref' and 'sec' modes
+    # output paths end with '_ref.zarr' or '_sec.zarr'
+    compressor = Blosc(cname='zstd', clevel=3, shuffle=Blosc.BITSHUFFLE)
     out_points = {}
     out_colors = {}
     for key in points:
-        outPath = os.path.join(points_dir, "{}_{}.nc".format(hashed_region,key))
-        points[key].to_netcdf(outPath)
+        outPath = os.path.join(points_dir, "{}_{}.zarr".format(hashed_region,key))
+        points[key].to_zarr(outPath, mode='w', encoding={
+            var: {'compressor': compressor} for var in points[key].data_vars})
         out_points[key] = outPath
     for key in colors:
-        outPath = os.path.join(color_dir, "{}_{}.nc".format(hashed_region,key))
-        colors[key].to_netcdf(outPath)
+        outPath = os.path.join(color_dir, "{}_{}.zarr".format(hashed_region,key))
+        colors[key].to_zarr(outPath, mode='w', encoding={
+            var: {'compressor': compressor} for var in colors[key].data_vars})
         out_colors[key] = outPath
     # outputs are the temporary files paths
     return out_points, out_colors
@@ -115,10 +226,6 @@ def write_dsm_by_tile(clouds_and_colors_as_str_list, resolution, epsg, tmp_dir,
     :param nb_bands: number of bands in color image
     :param output_stats: True if we save statistics with DSM tiles
     '''
-    # replace paths by opened Xarray datasets
-    xr_open_dict = lambda x: dict([(name, xr.open_dataset(value)) for name, value in x.items()])
-    clouds_and_colors_as_xr_list = [(xr_open_dict(k[0]), xr_open_dict(k[1])) for k in clouds_and_colors_as_str_list]
-
     # kwargs contains all the keyword arguments that will be passed to rasterization_wrapper
     # we need to extract a few of them
     xstart = kwargs.get('xstart')
@@ -131,8 +238,16 @@ def write_dsm_by_tile(clouds_and_colors_as_str_list, resolution, epsg, tmp_dir,
 
     hashed_region = region_hash_string([xstart,ystart,xsize,ysize])
 
-    # call to rasterization_wrapper
-    dsm = rasterization_wrapper(clouds_and_colors_as_xr_list, resolution, epsg, **kwargs)
+    # replace paths by opened Xarray datasets, which are all closed as soon as
+    # the rasterization is done
+    with contextlib.ExitStack() as opened_datasets:
+        xr_open_dict = lambda x: dict([(name, opened_datasets.enter_context(xr.open_zarr(value, chunks=None)))
+                                       for name, value in x.items()])
+        clouds_and_colors_as_xr_list = [(xr_open_dict(k[0]), xr_open_dict(k[1])) for k in clouds_and_colors_as_str_list]
+
+        # call to rasterization_wrapper
+        dsm = rasterization_wrapper(clouds_and_colors_as_xr_list, resolution, epsg,
+                                    color_dtype=color_dtype, **kwargs)
 
     # compute tile bounds
     tile_bounds = [xstart, ystart - resolution*ysize,xstart +resolution*xsize , ystart]
@@ -143,7 +258,7 @@ def write_dsm_by_tile(clouds_and_colors_as_str_list, resolution, epsg, tmp_dir,
 
     return hashed_region
 
-def rasterization_wrapper(clouds_and_colors, resolution, epsg, **kwargs):
+def rasterization_wrapper(clouds_and_colors, resolution, epsg, color_dtype=None, **kwargs):
     """
     Wrapper for rasterization step.
 
@@ -155,6 +270,8 @@ def rasterization_wrapper(clouds_and_colors, resolution, epsg, **kwargs):
     :type resolution: float
     :param  epsg_code: epsg code for the CRS of the output DSM
     :type epsg_code: int
+    :param color_dtype: type to cast projected colors to, so that the writer does not have to
+    :type color_dtype: numpy dtype
     :return: digital surface model + projected colors
     :rtype: xarray 2d tuple
     """
@@ -174,7 +291,278 @@ def rasterization_wrapper(clouds_and_colors, resolution, epsg, **kwargs):
         colors.extend(color_sec)
 
     # Call simple_rasterization
-    return rasterization.simple_rasterization_dataset(clouds, resolution, epsg, colors, **kwargs)
+    raster = rasterization.simple_rasterization_dataset(clouds, resolution, epsg, colors, **kwargs)
+
+    if raster is not None and color_dtype is not None:
+        raster['img'] = raster['img'].astype(color_dtype, copy=False)
+
+    return raster
+
+
+def locate_in_grid_triangles(grid_points, grid_shape, tree, query_points):
+    """
+    Locate points in the triangulation of a (possibly distorted) regular grid.
+
+    Each grid cell is split along its diagonal in two triangles. Since the grid
+    keeps its regular topology, the cell containing a point is found by walking
+    from a cell around the grid node nearest to this point towards the point, one
+    neighbouring cell at a time, and the triangle is then found using barycentric
+    coordinates. Points for which the walk does not settle (strongly distorted
+    grids) are located in a Delaunay triangulation of the grid instead.
+
+    Points outside of all triangles fall back to their nearest node, by a
+    degenerate triangle made of this node only.
+
+    The nearest nodes are queried using all cpus, and the walks are run by a
+    parallel numba kernel.
+
+    :param grid_points: positions of the grid nodes, flattened in row-major order
+    :type grid_points: np.ndarray of shape (N*M,2)
+    :param grid_shape: number of rows and columns of the grid
+    :type grid_shape: tuple(int, int)
+    :param tree: kd-tree built on grid_points
+    :type tree: scipy.spatial.cKDTree
+    :param query_points: positions to locate
+    :type query_points: np.ndarray of shape (...,2)
+    :returns: a tuple with the indices of the vertices of the triangle containing each point
+        and a mask which is False where no such triangle was found
+    :rtype: Tuple(np.ndarray of shape (...,3), np.ndarray of shape (...))
+    """
+    points = np.ascontiguousarray(query_points.reshape(-1, 2), dtype=np.float64)
+    grid_points = np.ascontiguousarray(grid_points, dtype=np.float64)
+
+    # kd-tree queries are spread over all cpus by scipy
+    nearest = tree.query(points, **KDTREE_QUERY_ALL_CPUS)[1].astype(np.int64)
+
+    simplices, found, resolved = _locate_in_grid_triangles(
+        grid_points, grid_shape[0], grid_shape[1], points, nearest)
+
+    # Locate the remaining points in a real triangulation of the grid
+    unresolved = np.flatnonzero(~resolved)
+    if unresolved.size > 0:
+        logging.debug("Locating {} points in a Delaunay triangulation".format(unresolved.size))
+        delaunay = Delaunay(grid_points)
+        delaunay_simplices = delaunay.find_simplex(points[unresolved])
+        in_triangle = delaunay_simplices >= 0
+        simplices[unresolved[in_triangle]] = delaunay.simplices[delaunay_simplices[in_triangle]]
+        found[unresolved] = in_triangle
+
+    shape = query_points.shape[:-1]
+    return simplices.reshape(shape + (3,)), found.reshape(shape)
+
+
+@njit((float64[:, :], int64, int64, float64, float64), nogil=True, cache=True)
+def _edge_side(grid_points, start, end, point_x, point_y):
+    """
+    Cross product of the grid edge from node start to node end with the
+    vector from node start to the point: its sign tells the side of the edge
+    the point is on
+    """
+    return (grid_points[end, 0] - grid_points[start, 0]) * (point_y - grid_points[start, 1]) \
+        - (grid_points[end, 1] - grid_points[start, 1]) * (point_x - grid_points[start, 0])
+
+
+@njit((float64[:, :], int64, int64, float64[:, :], int64[:]), parallel=True, nogil=True, cache=True)
+def _locate_in_grid_triangles(grid_points, nb_rows, nb_cols, points, nearest):
+    """
+    Cell walk and triangle search kernel of locate_in_grid_triangles
+
+    :param grid_points: positions of the grid nodes, flattened in row-major order
+    :type grid_points: float64 numpy.ndarray of shape (N*M,2)
+    :param nb_rows: number of rows of the grid
+    :type nb_rows: int
+    :param nb_cols: number of columns of the grid
+    :type nb_cols: int
+    :param points: positions to locate
+    :type points: float64 numpy.ndarray of shape (P,2)
+    :param nearest: index of the grid node nearest to each point
+    :type nearest: int64 numpy.ndarray of shape (P)
+    :returns: a tuple with triangles vertices indices, filled with the nearest node
+        where no triangle is found, triangle found mask, and a mask which is False
+        where the walk did not settle on a cell or outside of the grid
+    :rtype: Tuple(int64 numpy.ndarray of shape (P,3), bool numpy.ndarray of shape (P),
+        bool numpy.ndarray of shape (P))
+    """
+    nb_points = points.shape[0]
+    simplices = np.zeros((nb_points, 3), dtype=np.int64)
+    found = np.zeros(nb_points, dtype=np.bool_)
+    resolved = np.zeros(nb_points, dtype=np.bool_)
+
+    for idx in prange(nb_points):
+        point_x = points[idx, 0]
+        point_y = points[idx, 1]
+
+        # Start from the cell whose upper left node is the nearest node, or
+        # the closest cell to it on the last row and column
+        cell_row = min(nearest[idx] // nb_cols, nb_rows - 2)
+        cell_col = min(nearest[idx] % nb_cols, nb_cols - 2)
+
+        # A walk crosses at most all rows and columns of the grid
+        for _ in range(nb_rows + nb_cols):
+            upper_left = cell_row * nb_cols + cell_col
+            upper_right = upper_left + 1
+            lower_left = upper_left + nb_cols
+            lower_right = lower_left + 1
+
+            # Orientation of the cell, so that sides of its edges do not
+            # depend on the grid being mirrored in terrain coordinates
+            orientation = _edge_side(grid_points, upper_left, upper_right,
+                                     grid_points[lower_left, 0], grid_points[lower_left, 1])
+            if orientation == 0:
+                break
+            orientation = 1.0 if orientation > 0 else -1.0
+
+            # Step to the neighbouring cells across the edges the point is beyond
+            row_step = 0
+            if _edge_side(grid_points, upper_left, upper_right, point_x, point_y) * orientation < 0:
+                row_step = -1
+            elif _edge_side(grid_points, lower_left, lower_right, point_x, point_y) * orientation > 0:
+                row_step = 1
+            col_step = 0
+            if _edge_side(grid_points, upper_left, lower_left, point_x, point_y) * orientation > 0:
+                col_step = -1
+            elif _edge_side(grid_points, upper_right, lower_right, point_x, point_y) * orientation < 0:
+                col_step = 1
+
+            if row_step == 0 and col_step == 0:
+                # The point is in the cell, which is split along its diagonal
+                # in two triangles
+                for middle in (lower_left, upper_right):
+                    # Barycentric coordinates of the point in the triangle
+                    edge1_x = grid_points[middle, 0] - grid_points[upper_left, 0]
+                    edge1_y = grid_points[middle, 1] - grid_points[upper_left, 1]
+                    edge2_x = grid_points[lower_right, 0] - grid_points[upper_left, 0]
+                    edge2_y = grid_points[lower_right, 1] - grid_points[upper_left, 1]
+                    offset_x = point_x - grid_points[upper_left, 0]
+                    offset_y = point_y - grid_points[upper_left, 1]
+                    det = edge1_x * edge2_y - edge1_y * edge2_x
+                    if det == 0:
+                        continue
+                    coord1 = (offset_x * edge2_y - offset_y * edge2_x) / det
+                    coord2 = (edge1_x * offset_y - edge1_y * offset_x) / det
+
+                    if coord1 >= 0 and coord2 >= 0 and coord1 + coord2 <= 1:
+                        simplices[idx, 0] = upper_left
+                        simplices[idx, 1] = middle
+                        simplices[idx, 2] = lower_right
+                        found[idx] = True
+                        resolved[idx] = True
+                        break
+                # Otherwise the cell is not convex, leave the point unresolved
+                break
+
+            # Steps out of the grid are dropped, and the point is outside of
+            # the grid if no step is left
+            if not 0 <= cell_row + row_step <= nb_rows - 2:
+                row_step = 0
+            if not 0 <= cell_col + col_step <= nb_cols - 2:
+                col_step = 0
+            if row_step == 0 and col_step == 0:
+                resolved[idx] = True
+                break
+
+            cell_row += row_step
+            cell_col += col_step
+
+        # Fall back to the nearest node
+        if not found[idx]:
+            simplices[idx, 0] = nearest[idx]
+            simplices[idx, 1] = nearest[idx]
+            simplices[idx, 2] = nearest[idx]
+
+    return simplices, found, resolved
+
+
+@njit((float64[:, ::1], float64[:, ::1], float64[:, ::1], float64[:, ::1],
+       float64, float64, float64, float64), parallel=True, nogil=True, cache=True)
+def epipolar_tiles_regions(points_min_x, points_min_y, points_max_x, points_max_y,
+                           xmin, ymin, xmax, ymax):
+    """
+    Compute the epipolar region of each terrain tile, bounding the epipolar
+    points at its four corners, cropped to largest epipolar region (see
+    tiling.crop), and whether it is empty (see tiling.empty).
+
+    :param points_min_x: x of the minimum epipolar points at terrain grid nodes
+    :type points_min_x: float64 numpy.ndarray of shape (J,I)
+    :param points_min_y: y of the minimum epipolar points at terrain grid nodes
+    :type points_min_y: float64 numpy.ndarray of shape (J,I)
+    :param points_max_x: x of the maximum epipolar points at terrain grid nodes
+    :type points_max_x: float64 numpy.ndarray of shape (J,I)
+    :param points_max_y: y of the maximum epipolar points at terrain grid nodes
+    :type points_max_y: float64 numpy.ndarray of shape (J,I)
+    :param xmin, ymin, xmax, ymax: bounds of the largest epipolar region
+    :type xmin, ymin, xmax, ymax: float
+    :return: a tuple with regions as [xmin, ymin, xmax, ymax] and empty regions mask
+    :rtype: Tuple(float64 numpy.ndarray of shape (J-1,I-1,4), bool numpy.ndarray of shape (J-1,I-1))
+    """
+    nb_rows = points_min_x.shape[0] - 1
+    nb_cols = points_min_x.shape[1] - 1
+    regions = np.empty((nb_rows, nb_cols, 4), dtype=np.float64)
+    empty = np.empty((nb_rows, nb_cols), dtype=np.bool_)
+
+    for j in prange(nb_rows):
+        for i in range(nb_cols):
+            tile_min_x = min(points_min_x[j, i], points_min_x[j + 1, i],
+                             points_min_x[j + 1, i + 1], points_min_x[j, i + 1],
+                             points_max_x[j, i], points_max_x[j + 1, i],
+                             points_max_x[j + 1, i + 1], points_max_x[j, i + 1])
+            tile_min_y = min(points_min_y[j, i], points_min_y[j + 1, i],
+                             points_min_y[j + 1, i + 1], points_min_y[j, i + 1],
+                             points_max_y[j, i], points_max_y[j + 1, i],
+                             points_max_y[j + 1, i + 1], points_max_y[j, i + 1])
+            tile_max_x = max(points_min_x[j, i], points_min_x[j + 1, i],
+                             points_min_x[j + 1, i + 1], points_min_x[j, i + 1],
+                             points_max_x[j, i], points_max_x[j + 1, i],
+                             points_max_x[j + 1, i + 1], points_max_x[j, i + 1])
+            tile_max_y = max(points_min_y[j, i], points_min_y[j + 1, i],
+                             points_min_y[j + 1, i + 1], points_min_y[j, i + 1],
+                             points_max_y[j, i], points_max_y[j + 1, i],
+                             points_max_y[j + 1, i + 1], points_max_y[j, i + 1])
+
+            # Crop to largest region
+            tile_min_x = min(xmax, max(xmin, tile_min_x))
+            tile_min_y = min(ymax, max(ymin, tile_min_y))
+            tile_max_x = min(xmax, max(xmin, tile_max_x))
+            tile_max_y = min(ymax, max(ymin, tile_max_y))
+
+            regions[j, i, 0] = tile_min_x
+            regions[j, i, 1] = tile_min_y
+            regions[j, i, 2] = tile_max_x
+            regions[j, i, 3] = tile_max_y
+            empty[j, i] = tile_min_x >= tile_max_x or tile_min_y >= tile_max_y
+
+    return regions, empty
+
+
+@njit((float64[:, :, :],), nogil=True, cache=True)
+def min_max_over_vertices(points):
+    """
+    Compute minimum and maximum coordinates of each set of vertices, in a single
+    pass over the points.
+
+    :param points: vertices coordinates, one set of vertices per row
+    :type points: float64 numpy.ndarray of shape (N,V,D)
+    :return: a tuple with minimum and maximum coordinates of each set of vertices
+    :rtype: Tuple(float64 numpy.ndarray of shape (N,D), float64 numpy.ndarray of shape (N,D))
+    """
+    nb_sets, nb_vertices, nb_dims = points.shape
+    coords_min = np.empty((nb_sets, nb_dims), dtype=np.float64)
+    coords_max = np.empty((nb_sets, nb_dims), dtype=np.float64)
+
+    for i in range(nb_sets):
+        for dim in range(nb_dims):
+            cur_min = points[i, 0, dim]
+            cur_max = cur_min
+            for vertex in range(1, nb_vertices):
+                value = points[i, vertex, dim]
+                if value < cur_min:
+                    cur_min = value
+                elif value > cur_max:
+                    cur_max = value
+            coords_min[i, dim] = cur_min
+            coords_max[i, dim] = cur_max
+
+    return coords_min, coords_max
 
 
 def run(
@@ -249,7 +637,8 @@ def run(
             raise
     tmp_dir = os.path.join(out_dir, 'tmp')
 
-    utils.add_log_file(out_dir, 'compute_dsm')
+    log_file = utils.add_log_file(out_dir, 'compute_dsm')
+    log_level = logging.getLogger().getEffectiveLevel()
     logging.info(
         "Received {} stereo pairs configurations".format(len(in_jsons)))
 
@@ -274,7 +663,7 @@ def run(
     }
 
     if use_geoid_alt:
-        geoid_data = utils.read_geoid_file()
+        geoid_data = get_geoid_data()
         out_json[params.stereo_section_tag][params.stereo_output_section_tag][params.alt_reference_tag] = 'geoid'
     else:
         geoid_data = None
@@ -314,9 +703,7 @@ def run(
         # Append input configuration to output json
         out_json[params.stereo_inputs_section_tag].append(configuration)
 
-        configurations_data[config_id] = {}
-
-        configurations_data[config_id]['configuration'] = configuration
+        configurations_data[config_id] = ConfigurationData(configuration)
         
         # Check left image and raise a warning if different left images are used along with snap_to_img1 mpode
         if ref_left_image is None:
@@ -331,62 +718,61 @@ def run(
                                    preprocessing_output_config[params.epipolar_size_x_tag],
                                    preprocessing_output_config[params.epipolar_size_y_tag]]
 
-        configurations_data[config_id]['largest_epipolar_region'] = largest_epipolar_region
+        configurations_data[config_id].largest_epipolar_region = largest_epipolar_region
 
         disp_min = preprocessing_output_config[params.minimum_disparity_tag]
         disp_max = preprocessing_output_config[params.maximum_disparity_tag]
         disp_to_alt_ratio = preprocessing_output_config[params.disp_to_alt_ratio_tag]
+        inv_disp_to_alt_ratio = 1.0 / disp_to_alt_ratio
 
         # Check if we need to override disp_min
         if min_elevation_offset is not None:
-            user_disp_min = min_elevation_offset / disp_to_alt_ratio
+            user_disp_min = min_elevation_offset * inv_disp_to_alt_ratio
             if user_disp_min > disp_min:
                 logging.warning(
-                    ('Overriden disparity minimum = {:.3f} pix. (or {:.3f} m.) is greater '
-                     'than disparity minimum estimated in prepare step = {:.3f} pix. (or '
-                     '{:.3f} m.) for configuration {}').format(
-                        user_disp_min,
-                        min_elevation_offset,
-                        disp_min,
-                        disp_min * disp_to_alt_ratio,
-                        config_id))
+                    'Overriden disparity minimum = %.3f pix. (or %.3f m.) is greater '
+                    'than disparity minimum estimated in prepare step = %.3f pix. (or '
+                    '%.3f m.) for configuration %s',
+                    user_disp_min,
+                    min_elevation_offset,
+                    disp_min,
+                    disp_min * disp_to_alt_ratio,
+                    config_id)
                 disp_min = user_disp_min
 
         # Check if we need to override disp_max
         if max_elevation_offset is not None:
-            user_disp_max = max_elevation_offset / disp_to_alt_ratio
+            user_disp_max = max_elevation_offset * inv_disp_to_alt_ratio
             if user_disp_max < disp_max:
                 logging.warning(
-                    ('Overriden disparity maximum = {:.3f} pix. (or {:.3f} m.) is lower '
-                     'than disparity maximum estimated in prepare step = {:.3f} pix. (or '
-                     '{:.3f} m.) for configuration {}').format(
-                        user_disp_max,
-                        max_elevation_offset,
-                        disp_max,
-                        disp_max * disp_to_alt_ratio,
-                        config_id))
+                    'Overriden disparity maximum = %.3f pix. (or %.3f m.) is lower '
+                    'than disparity maximum estimated in prepare step = %.3f pix. (or '
+                    '%.3f m.) for configuration %s',
+                    user_disp_max,
+                    max_elevation_offset,
+                    disp_max,
+                    disp_max * disp_to_alt_ratio,
+                    config_id)
             disp_max = user_disp_max
 
         logging.info(
-            'Disparity range for config {}: [{:.3f} pix., {:.3f} pix.] (or [{:.3f} m., {:.3f} m.])'.format(
-                config_id,
-                disp_min,
-                disp_max,
-                disp_min *
-                disp_to_alt_ratio,
-                disp_max *
-                disp_to_alt_ratio))
+            'Disparity range for config %s: [%.3f pix., %.3f pix.] (or [%.3f m., %.3f m.])',
+            config_id,
+            disp_min,
+            disp_max,
+            disp_min * disp_to_alt_ratio,
+            disp_max * disp_to_alt_ratio)
 
-        configurations_data[config_id]['disp_min'] = disp_min
-        configurations_data[config_id]['disp_max'] = disp_max
+        configurations_data[config_id].disp_min = disp_min
+        configurations_data[config_id].disp_max = disp_max
 
         origin = [preprocessing_output_config[params.epipolar_origin_x_tag],
                   preprocessing_output_config[params.epipolar_origin_y_tag]]
         spacing = [preprocessing_output_config[params.epipolar_spacing_x_tag],
                    preprocessing_output_config[params.epipolar_spacing_y_tag]]
 
-        configurations_data[config_id]['origin'] = origin
-        configurations_data[config_id]['spacing'] = spacing
+        configurations_data[config_id].origin = origin
+        configurations_data[config_id].spacing = spacing
 
         logging.info("Size of epipolar image: {}".format(
             largest_epipolar_region))
@@ -401,10 +787,8 @@ def run(
 
         # Numpy array with corners of largest epipolar region. Order
         # does not matter here, since it will be passed to stereo.compute_epipolar_grid_min_max
-        corners = np.array([[[largest_epipolar_region[0],largest_epipolar_region[1]],
-                             [largest_epipolar_region[0], largest_epipolar_region[3]]], 
-                            [[largest_epipolar_region[2], largest_epipolar_region[3]], 
-                             [largest_epipolar_region[2], largest_epipolar_region[1]]]], dtype=np.float64)
+        x_0, y_0, x_1, y_1 = largest_epipolar_region
+        corners = np.array([x_0, y_0, x_0, y_1, x_1, y_1, x_1, y_0], dtype=np.float64).reshape(2, 2, 2)
 
         # get utm zone with the middle point of terrain_min if epsg is
         # None
@@ -430,10 +814,10 @@ def run(
 
         terrain_area = (terrain_max[0]-terrain_min[0])*(terrain_max[1]-terrain_min[1])
 
-        configurations_data[config_id]['terrain_area'] = terrain_area
+        configurations_data[config_id].terrain_area = terrain_area
 
         logging.info(
-            "Terrain area covered: {} square meters (or square degrees)".format(terrain_area))
+            "Terrain area covered: %s square meters (or square degrees)", terrain_area)
 
         # Retrieve bounding box of the ground intersection of the envelopes
         inter_poly, inter_epsg = utils.read_vector(
@@ -448,16 +832,19 @@ def run(
         xmin, ymin, xmax, ymax = tiling.snap_to_grid(
             inter_xmin, inter_ymin, inter_xmax, inter_ymax, resolution)
 
-        logging.info("Terrain bounding box : [{}, {}] x [{}, {}]".format(xmin,
-                                                                         xmax,
-                                                                         ymin,
-                                                                         ymax))
+        logging.info("Terrain bounding box : [%s, %s] x [%s, %s]",
+                     xmin, xmax, ymin, ymax)
 
-        configurations_data[config_id]['terrain_bounding_box'] = [
+        configurations_data[config_id].terrain_bounding_box = [
             xmin, ymin, xmax, ymax]
 
         if roi is not None:
-            if not roi_poly.intersects(inter_poly):
+            # Compare bounding boxes first, which is enough to discard
+            # disjoint pairs without a full polygon intersection test
+            roi_bounds = roi_poly.bounds
+            if roi_bounds[2] < inter_xmin or roi_bounds[0] > inter_xmax or \
+                    roi_bounds[3] < inter_ymin or roi_bounds[1] > inter_ymax or \
+                    not roi_poly.intersects(inter_poly):
                 logging.warning("The pair composed of {} and {} does not intersect the requested ROI".format(
                     configuration[params.input_section_tag][params.img1_tag],
                     configuration[params.input_section_tag][params.img2_tag]
@@ -475,33 +862,23 @@ def run(
                 opt_epipolar_tile_size,
                 opt_epipolar_tile_size))
 
-        configurations_data[config_id]['opt_epipolar_tile_size'] = opt_epipolar_tile_size
-
-        # Split epipolar image in pieces
-        epipolar_regions = tiling.split(0,
-                                        0,
-                                        preprocessing_output_config[params.epipolar_size_x_tag],
-                                        preprocessing_output_config[params.epipolar_size_y_tag],
-                                        opt_epipolar_tile_size,
-                                        opt_epipolar_tile_size)
-        epipolar_regions_grid = tiling.grid(0,
-                                            0,
-                                            preprocessing_output_config[params.epipolar_size_x_tag],
-                                            preprocessing_output_config[params.epipolar_size_y_tag],
-                                            opt_epipolar_tile_size,
-                                            opt_epipolar_tile_size)
-        
-        configurations_data[config_id]['epipolar_regions'] = epipolar_regions
-        configurations_data[config_id]['epipolar_regions_grid'] = epipolar_regions_grid
+        configurations_data[config_id].opt_epipolar_tile_size = opt_epipolar_tile_size
+
+        # Epipolar regions and grid are only generated when tasks are
+        # submitted, only their number is needed until then
+        nb_epipolar_regions = math.ceil(largest_epipolar_region[2] / opt_epipolar_tile_size) * \
+                              math.ceil(largest_epipolar_region[3] / opt_epipolar_tile_size)
+
+        configurations_data[config_id].nb_epipolar_regions = nb_epipolar_regions
 
         logging.info("Epipolar image will be processed in {} splits".format(
-            len(epipolar_regions)))
+            nb_epipolar_regions))
 
         # Increment config index
         config_idx += 1
 
     xmin, ymin, xmax, ymax = tiling.union(
-        [conf['terrain_bounding_box'] for config_id, conf in configurations_data.items()])
+        [conf.terrain_bounding_box for config_id, conf in configurations_data.items()])
 
     if roi is not None:
         # terrain bounding box polygon
@@ -526,8 +903,7 @@ def run(
 
     for config_id, conf in configurations_data.items():
         # Compute terrain area covered by a single epipolar tile
-        terrain_area_covered_by_epipolar_tile = conf["terrain_area"] / len(
-            epipolar_regions)
+        terrain_area_covered_by_epipolar_tile = conf.terrain_area / conf.nb_epipolar_regions
 
         # Compute tile width in pixels
         optimal_terrain_tile_widths.append(
@@ -586,6 +962,20 @@ def run(
     else:
         stereo_out_epsg = epsg
 
+    # in the following code a factor is used to increase the precision,
+    # epsg being the same for all configurations
+    spatial_ref = osr.SpatialReference()
+    spatial_ref.ImportFromEPSG(epsg)
+    if spatial_ref.IsGeographic():
+        precision_factor = 1000.0
+    else:
+        precision_factor = 1.0
+
+    if precision_factor != 1.0:
+        scaled_terrain_grid = terrain_grid * precision_factor
+    else:
+        scaled_terrain_grid = terrain_grid
+
     # Submit all epipolar regions to be processed as delayed tasks, and
     # project terrain grid to epipolar
     for config_id, conf in configurations_data.items():
@@ -593,103 +983,152 @@ def run(
         # processed as points cloud
         delayed_point_clouds = []
 
+        # Split epipolar image in pieces, generated while tasks are submitted
+        epipolar_regions = tiling.iter_split(*conf.largest_epipolar_region,
+                                             conf.opt_epipolar_tile_size,
+                                             conf.opt_epipolar_tile_size)
+
         if use_dask[mode]:
-            # Use Dask delayed
-            for region in conf['epipolar_regions']:
+            # Send configurations to workers once, so that delayed tasks only
+            # hold a reference to them
+            configuration_future, corr_config_future = client.scatter(
+                [conf.configuration, corr_config], broadcast=True)
+
+            # Use Dask delayed, keeping the regions in the same order
+            processed_regions = []
+            for region in epipolar_regions:
+                processed_regions.append(region)
                 delayed_point_clouds.append(dask.delayed(stereo.images_pair_to_3d_points)(
-                    conf['configuration'], region, corr_config, disp_min=conf[
-                        'disp_min'], disp_max=conf['disp_max'],
+                    configuration_future, region, corr_config_future,
+                    disp_min=conf.disp_min, disp_max=conf.disp_max,
                     geoid_data=geoid_data_futures, out_epsg=stereo_out_epsg,
                     use_sec_disp=use_sec_disp, snap_to_img1 = snap_to_img1, align=align))
             logging.info(
                 "Submitted {} epipolar delayed tasks to dask for stereo configuration {}".format(
                 len(delayed_point_clouds), config_id))
+            epipolar_regions = processed_regions
         else:
             # Use multiprocessing module
 
-            # create progress bar with an update callback
-            pbar = tqdm(total=len(conf['epipolar_regions']))
-            def update(args): pbar.update()
-
-            # create a thread pool 
-            pool = multiprocessing.Pool(nb_workers)
-
-            # launch several 'write_3d_points()' to process each epipolar region
-            for region in conf['epipolar_regions']:
-                delayed_point_clouds.append(pool.apply_async(write_3d_points,
-                    args=(conf['configuration'], region, corr_config,
-                          tmp_dir, config_id),
-                    kwds={'disp_min':conf['disp_min'],
-                          'disp_max':conf['disp_max'],
-                          'geoid_data':geoid_data,
-                          'out_epsg':stereo_out_epsg,
-                          'use_sec_disp':use_sec_disp},
-                    callback=update))
-
-            # Wait computation results (timeout in seconds) and replace the
-            # async objects by the actual output of write_3d_points(), meaning
-            # the paths to cloud files
-            delayed_point_clouds = [delayed_pc.get(timeout=perJobTimeout) for delayed_pc in delayed_point_clouds]
+            # create progress bar, throttled so that it is not redrawn for
+            # each region
+            pbar = tqdm(total=conf.nb_epipolar_regions,
+                        miniters=max(1, conf.nb_epipolar_regions // 200),
+                        mininterval=0.5, smoothing=0)
+
+            # create a process pool, forked from a light server process
+            # rather than from the current one so that workers do not inherit
+            # its memory, and serialize the configuration once for all workers
+            pool = multiprocessing.get_context('forkserver').Pool(
+                nb_workers, initializer=_init_worker_configuration,
+                initargs=(pickle.dumps(conf.configuration), log_file, log_level))
+
+            # stream the arguments of each 'write_3d_points()' call to the
+            # workers, so that only a few chunks of tasks are in flight
+            kwargs = {'disp_min':conf.disp_min,
+                      'disp_max':conf.disp_max,
+                      'geoid_data':geoid_data,
+                      'out_epsg':stereo_out_epsg,
+                      'use_sec_disp':use_sec_disp}
+            args_iter = ((region, corr_config, tmp_dir, config_id, kwargs)
+                         for region in epipolar_regions)
+            chunksize = max(1, conf.nb_epipolar_regions // (nb_workers * 4))
+            results = pool.imap_unordered(_write_3d_points_in_worker, args_iter,
+                                          chunksize=chunksize)
+
+            # Wait computation results (timeout in seconds, for a whole chunk)
+            # meaning the paths to cloud files. Results come in completion
+            # order, so keep the regions in the same order.
+            processed_regions = []
+            for _ in range(conf.nb_epipolar_regions):
+                region, point_clouds = results.next(timeout=perJobTimeout * chunksize)
+                processed_regions.append(region)
+                delayed_point_clouds.append(point_clouds)
+                pbar.update()
+            pbar.close()
+            epipolar_regions = processed_regions
 
             # closing thread pool when computation is done
             pool.close()
             pool.join()
 
-        configurations_data[config_id]['delayed_point_clouds'] = delayed_point_clouds
-
-        # build list of epipolar region hashes
-        configurations_data[config_id]['epipolar_regions_hash'] = [
-            region_hash_string(k) for k in conf['epipolar_regions']]
+        # arrange delayed point clouds on the regular grid of epipolar
+        # tiles, starting from (0, 0), as (row, column) = (y, x) indices
+        epipolar_tile_size = conf.opt_epipolar_tile_size
+        delayed_point_clouds_grid = np.empty(
+            (math.ceil(conf.largest_epipolar_region[3] / epipolar_tile_size),
+             math.ceil(conf.largest_epipolar_region[2] / epipolar_tile_size)),
+            dtype=object)
+        for region, delayed_pc in zip(epipolar_regions, delayed_point_clouds):
+            delayed_point_clouds_grid[int(region[1] // epipolar_tile_size),
+                                      int(region[0] // epipolar_tile_size)] = delayed_pc
+        configurations_data[config_id].delayed_point_clouds_grid = delayed_point_clouds_grid
 
         # Compute disp_min and disp_max location for epipolar grid
-        epipolar_grid_min, epipolar_grid_max = stereo.compute_epipolar_grid_min_max(conf['epipolar_regions_grid'], epsg, conf["configuration"],conf['disp_min'], conf['disp_max'])
+        epipolar_regions_grid = tiling.grid(*conf.largest_epipolar_region,
+                                            conf.opt_epipolar_tile_size,
+                                            conf.opt_epipolar_tile_size)
+        epipolar_grid_min, epipolar_grid_max = stereo.compute_epipolar_grid_min_max(epipolar_regions_grid, epsg, conf.configuration,conf.disp_min, conf.disp_max)
 
-        epipolar_regions_grid_flat = conf['epipolar_regions_grid'].reshape(-1, conf['epipolar_regions_grid'].shape[-1])
+        epipolar_regions_grid_flat = epipolar_regions_grid.reshape(-1, epipolar_regions_grid.shape[-1])
 
-        # in the following code a factor is used to increase the precision
-        spatial_ref = osr.SpatialReference()
-        spatial_ref.ImportFromEPSG(epsg)
-        if spatial_ref.IsGeographic():
-            precision_factor = 1000.0
+        # Scale grids once, no scaling is needed for projected CRS
+        if precision_factor != 1.0:
+            scaled_grid_min = epipolar_grid_min * precision_factor
+            scaled_grid_max = epipolar_grid_max * precision_factor
         else:
-            precision_factor = 1.0
-
-        # Build delaunay_triangulation
-        delaunay_min = Delaunay(epipolar_grid_min*precision_factor)
-        delaunay_max = Delaunay(epipolar_grid_max*precision_factor)
-
-        # Build kdtrees
-        tree_min = cKDTree(epipolar_grid_min*precision_factor)
-        tree_max = cKDTree(epipolar_grid_max*precision_factor)
-        
-        # Look-up terrain_grid with Delaunay
-        s_min = tsearch(delaunay_min, terrain_grid*precision_factor)
-        s_max = tsearch(delaunay_max, terrain_grid*precision_factor)
-
-        points_disp_min = epipolar_regions_grid_flat[delaunay_min.simplices[s_min]]
-        points_disp_max = epipolar_regions_grid_flat[delaunay_max.simplices[s_max]]
-        nn_disp_min = epipolar_regions_grid_flat[tree_min.query(terrain_grid*precision_factor)[1]]
-        nn_disp_max = epipolar_regions_grid_flat[tree_max.query(terrain_grid*precision_factor)[1]]
-
-        points_disp_min_min = np.min(points_disp_min, axis=2)
-        points_disp_min_max = np.max(points_disp_min, axis=2)
-        points_disp_max_min = np.min(points_disp_max, axis=2)
-        points_disp_max_max = np.max(points_disp_max, axis=2)
-
-        # Use either Delaunay search or NN search if delaunay search fails (point outside triangles)
-        points_disp_min_min = np.where(np.stack((s_min, s_min), axis=-1) != -1, points_disp_min_min, nn_disp_min)
-        points_disp_min_max = np.where(np.stack((s_min, s_min), axis=-1) != -1, points_disp_min_max, nn_disp_min)
-        points_disp_max_min = np.where(np.stack((s_max, s_max), axis=-1) != -1, points_disp_max_min, nn_disp_max)
-        points_disp_max_max = np.where(np.stack((s_max, s_max), axis=-1) != -1, points_disp_max_max, nn_disp_max)
-        
-        points = np.stack((points_disp_min_min, points_disp_min_max,
-                                 points_disp_max_min, points_disp_max_max), axis=0)
-        
-        points_min = np.min(points, axis=0)
-        points_max = np.max(points, axis=0)
-
-        configurations_data[config_id]['epipolar_points_min'] = points_min
-        configurations_data[config_id]['epipolar_points_max'] = points_max
+            scaled_grid_min = epipolar_grid_min
+            scaled_grid_max = epipolar_grid_max
+
+        # Build kdtrees, used once for both triangle and nearest neighbour
+        # search so that balancing the trees is not worth it
+        tree_min = cKDTree(scaled_grid_min, leafsize=32,
+                           balanced_tree=False, compact_nodes=False)
+        tree_max = cKDTree(scaled_grid_max, leafsize=32,
+                           balanced_tree=False, compact_nodes=False)
+
+        # Look-up terrain_grid in the triangulated epipolar grids
+        grid_shape = epipolar_regions_grid.shape[:2]
+        # Use either triangle search or NN search if triangle search fails (point
+        # outside triangles), which is done by the look-up itself
+        s_min, _ = locate_in_grid_triangles(
+            scaled_grid_min, grid_shape, tree_min, scaled_terrain_grid)
+        s_max, _ = locate_in_grid_triangles(
+            scaled_grid_max, grid_shape, tree_max, scaled_terrain_grid)
+
+        points_disp_min = epipolar_regions_grid_flat[s_min]
+        points_disp_max = epipolar_regions_grid_flat[s_max]
+
+        # Bounds of the epipolar triangles containing the terrain grid points
+        points_shape = points_disp_min.shape[:-2] + points_disp_min.shape[-1:]
+        points_disp_min_min, points_disp_min_max = min_max_over_vertices(
+            points_disp_min.reshape((-1,) + points_disp_min.shape[-2:]))
+        points_disp_max_min, points_disp_max_max = min_max_over_vertices(
+            points_disp_max.reshape((-1,) + points_disp_max.shape[-2:]))
+        points_disp_min_min = points_disp_min_min.reshape(points_shape)
+        points_disp_min_max = points_disp_min_max.reshape(points_shape)
+        points_disp_max_min = points_disp_max_min.reshape(points_shape)
+        points_disp_max_max = points_disp_max_max.reshape(points_shape)
+
+        # Minimum bounds are never above maximum bounds, so only two arrays
+        # need to be reduced for each of points_min and points_max
+        points_min = np.minimum(points_disp_min_min, points_disp_max_min)
+        points_max = np.maximum(points_disp_min_max, points_disp_max_max)
+
+        # Split coordinates in contiguous x and y arrays, so that the
+        # reductions below run over contiguous memory
+        points_min_x = np.ascontiguousarray(points_min[..., 0])
+        points_min_y = np.ascontiguousarray(points_min[..., 1])
+        points_max_x = np.ascontiguousarray(points_max[..., 0])
+        points_max_y = np.ascontiguousarray(points_max[..., 1])
+
+        # Bounds of the epipolar region of each terrain tile, from the
+        # epipolar points of its four corners
+        x_0, y_0, x_1, y_1 = conf.largest_epipolar_region
+        (configurations_data[config_id].epipolar_tiles_regions,
+         configurations_data[config_id].epipolar_tiles_empty) = epipolar_tiles_regions(
+            points_min_x, points_min_y, points_max_x, points_max_y,
+            float(x_0), float(y_0), float(x_1), float(y_1))
 
     # Retrieve number of bands
     if params.color1_tag in configuration[params.input_section_tag]:
@@ -708,14 +1147,23 @@ def run(
     delayed_dsm_tiles = []
     number_of_epipolar_tiles_per_terrain_tiles = []
 
-    if not use_dask[mode]:
-        # create progress bar with update callback
-        pbar = tqdm(
-            total=number_of_terrain_splits,
-            desc="Finding correspondences between terrain and epipolar tiles")
-        def update(args): pbar.update()
-        # initialize a thread pool for multiprocessing mode
-        pool = multiprocessing.Pool(nb_workers)
+    # cloud filtering params, which do not depend on terrain tiles
+    if cloud_small_components_filter:
+        small_cpn_filter_params = static_cfg.get_small_components_filter_params()
+    else:
+        small_cpn_filter_params = None
+
+    if cloud_statistical_outliers_filter:
+        statistical_filter_params = static_cfg.get_statistical_outliers_filter_params()
+    else:
+        statistical_filter_params = None
+
+    # rasterization grid division factor
+    rasterization_params = static_cfg.get_rasterization_params()
+    grid_points_division_factor = getattr(rasterization_params, static_cfg.grid_points_division_factor_tag)
+
+    # color encoding of the output tiles
+    color_dtype = static_cfg.get_color_image_encoding()
 
     # Loop on terrain regions and derive dependency to epipolar regions
     for terrain_region_dix in tqdm(range(number_of_terrain_splits),
@@ -740,82 +1188,37 @@ def run(
         # For each stereo configuration
         for config_id, conf in configurations_data.items():
 
-            epipolar_points_min = conf['epipolar_points_min']
-            epipolar_points_max = conf['epipolar_points_max']
-
-            tile_min = np.minimum(np.minimum(np.minimum(epipolar_points_min[j,i], epipolar_points_min[j+1 ,i]),
-                                             np.minimum(epipolar_points_min[j+1,i+1], epipolar_points_min[j ,i+1])),
-                                  np.minimum(np.minimum(epipolar_points_max[j,i], epipolar_points_max[j+1 ,i]),
-                                             np.minimum(epipolar_points_max[j+1,i+1], epipolar_points_max[j ,i+1])))
-
-            tile_max = np.maximum(np.maximum(np.maximum(epipolar_points_min[j,i], epipolar_points_min[j+1 ,i]),
-                                             np.maximum(epipolar_points_min[j+1,i+1], epipolar_points_min[j ,i+1])),
-                                  np.maximum(np.maximum(epipolar_points_max[j,i], epipolar_points_max[j+1 ,i]),
-                                             np.maximum(epipolar_points_max[j+1,i+1], epipolar_points_max[j ,i+1])))
-
-
-            # Bouding region of corresponding cell
-            epipolar_region_minx = tile_min[0]
-            epipolar_region_miny = tile_min[1]
-            epipolar_region_maxx = tile_max[0]
-            epipolar_region_maxy = tile_max[1]
-
-            # This mimics the previous code that was using
-            # transform_terrain_region_to_epipolar
-            epipolar_region = [epipolar_region_minx, epipolar_region_miny,
-                               epipolar_region_maxx, epipolar_region_maxy]
-
-            # Crop epipolar region to largest region
-            epipolar_region = tiling.crop(
-                epipolar_region, conf['largest_epipolar_region'])
+            epipolar_region = conf.epipolar_tiles_regions[j, i].tolist()
 
             logging.debug(
                 "Corresponding epipolar region: {}".format(epipolar_region))
 
             # Check if the epipolar region contains any pixels to process
-            if tiling.empty(epipolar_region):
+            if conf.epipolar_tiles_empty[j, i]:
                 logging.debug(
                     "Skipping terrain region because corresponding epipolar region is empty")
             else:
 
-                # Loop on all epipolar tiles covered by epipolar region
-                for epipolar_tile in tiling.list_tiles(
-                        epipolar_region,
-                        conf['largest_epipolar_region'],
-                        conf['opt_epipolar_tile_size']):
-
-                    cur_hash = region_hash_string(epipolar_tile)
+                # Range of epipolar tiles covered by epipolar region, with
+                # one neighboring tile of margin, clamped to the tiles of
+                # largest region
+                nb_rows, nb_cols = conf.delayed_point_clouds_grid.shape
+                tile_size = conf.opt_epipolar_tile_size
+                col_min = max(0, math.floor(epipolar_region[0] / tile_size) - 1)
+                row_min = max(0, math.floor(epipolar_region[1] / tile_size) - 1)
+                col_max = min(nb_cols, math.ceil(epipolar_region[2] / tile_size) + 1)
+                row_max = min(nb_rows, math.ceil(epipolar_region[3] / tile_size) + 1)
 
-                    # Look for corresponding hash in delayed point clouds
-                    # dictionnary
-                    if cur_hash in conf['epipolar_regions_hash']:
-
-                        # If hash can be found, append it to the required
-                        # clouds to compute for this terrain tile
-                        pos = conf['epipolar_regions_hash'].index(cur_hash)
-                        required_point_clouds.append(
-                            conf['delayed_point_clouds'][pos])
+                # Append the clouds of all these tiles, x-major, to the
+                # required clouds to compute for this terrain tile
+                required_point_clouds.extend(
+                    conf.delayed_point_clouds_grid[row_min:row_max, col_min:col_max].T.ravel().tolist())
 
 
         # start and size parameters for the rasterization function
         xstart, ystart, xsize, ysize = tiling.roi_to_start_and_size(
             terrain_region, resolution)
 
-        # cloud filtering params
-        if cloud_small_components_filter:
-            small_cpn_filter_params = static_cfg.get_small_components_filter_params()
-        else:
-            small_cpn_filter_params = None
-
-        if cloud_statistical_outliers_filter:
-            statistical_filter_params = static_cfg.get_statistical_outliers_filter_params()
-        else:
-            statistical_filter_params = None
-
-        # rasterization grid division factor
-        rasterization_params = static_cfg.get_rasterization_params()
-        grid_points_division_factor = getattr(rasterization_params, static_cfg.grid_points_division_factor_tag)
-
         if len(required_point_clouds) > 0:
             logging.debug(
                 "Number of clouds to process for this terrain tile: {}".format(
@@ -825,7 +1228,8 @@ def run(
                 # Delayed call to rasterization operations using all required
                 # point clouds
                 rasterized = dask.delayed(rasterization_wrapper)(
-                    required_point_clouds, resolution, epsg, xstart=xstart,
+                    required_point_clouds, resolution, epsg,
+                    color_dtype=color_dtype, xstart=xstart,
                     ystart=ystart, xsize=xsize, ysize=ysize,
                     radius=dsm_radius, sigma=sigma, dsm_no_data=dsm_no_data,
                     color_no_data=color_no_data, small_cpn_filter_params=small_cpn_filter_params,
@@ -838,16 +1242,15 @@ def run(
                 rank.append(i*i+j*j)
 
             else:
-                # Launch asynchrone job for write_dsm_by_tile()
-                delayed_dsm_tiles.append(pool.apply_async(write_dsm_by_tile,
-                    args=(required_point_clouds,resolution,epsg,tmp_dir, nb_bands,
-                          static_cfg.get_color_image_encoding(), output_stats),
-                          kwds={'xstart':xstart, 'ystart':ystart, 'xsize': xsize, 'ysize': ysize, 'radius':dsm_radius,
-                                'sigma':sigma, 'dsm_no_data':dsm_no_data, 'color_no_data':color_no_data,
-                                'small_cpn_filter_params':small_cpn_filter_params,
-                                'statistical_filter_params': statistical_filter_params,
-                                'grid_points_division_factor': grid_points_division_factor},
-                    callback=update))
+                # Job for write_dsm_by_tile(), submitted once all tiles are listed
+                delayed_dsm_tiles.append(functools.partial(write_dsm_by_tile,
+                    required_point_clouds, resolution, epsg, tmp_dir, nb_bands,
+                    color_dtype, output_stats,
+                    xstart=xstart, ystart=ystart, xsize=xsize, ysize=ysize, radius=dsm_radius,
+                    sigma=sigma, dsm_no_data=dsm_no_data, color_no_data=color_no_data,
+                    small_cpn_filter_params=small_cpn_filter_params,
+                    statistical_filter_params=statistical_filter_params,
+                    grid_points_division_factor=grid_points_division_factor))
 
             number_of_epipolar_tiles_per_terrain_tiles.append(
                 len(required_point_clouds))
@@ -879,12 +1282,12 @@ def run(
         # Transform all delayed raster tiles to futures (computation starts
         # immediatly on workers, assynchronously)
         future_dsm_tiles = client.compute(delayed_dsm_tiles)
-    
+
         logging.info("DSM output image size: {}x{} pixels".format(xsize, ysize))
 
         readwrite.write_geotiff_dsm(future_dsm_tiles, out_dir, xsize, ysize,
                                     bounds, resolution, epsg, nb_bands, dsm_no_data,
-                                    color_no_data, color_dtype = static_cfg.get_color_image_encoding(),
+                                    color_no_data, color_dtype = color_dtype,
                                     write_color=True, write_stats=output_stats)
 
         # stop cluster
@@ -892,35 +1295,65 @@ def run(
 
     else:
         logging.info("Computing DSM tiles ...")
-        # Wait for asynchrone jobs (timeout in seconds) and replace them by
-        # write_dsm_by_tile() output
-        delayed_dsm_tiles = [delayed_tile.get(timeout=perJobTimeout) for delayed_tile in delayed_dsm_tiles]
+        pbar = tqdm(
+            total=len(delayed_dsm_tiles),
+            desc="Finding correspondences between terrain and epipolar tiles")
+
+        # Launch asynchrone write_dsm_by_tile() jobs in a process pool, forked
+        # from a light server process as well
+        rasterization_pool = ProcessPoolExecutor(
+            max_workers=nb_workers, mp_context=multiprocessing.get_context('forkserver'),
+            initializer=_init_worker_logging, initargs=(log_file, log_level))
+        futures = [rasterization_pool.submit(job) for job in delayed_dsm_tiles]
+
+        # Wait computation results (timeout in seconds, for each job) and
+        # replace jobs by write_dsm_by_tile() output
+        try:
+            dsm_tiles = []
+            for future in futures:
+                dsm_tiles.append(future.result(timeout=perJobTimeout))
+                pbar.update()
+        except BaseException:
+            # do not run the pending jobs before raising
+            for future in futures:
+                future.cancel()
+            rasterization_pool.shutdown(wait=False)
+            raise
+        pbar.close()
+        delayed_dsm_tiles = dsm_tiles
 
-        # closing the tread pool after computation
-        pool.close()
-        pool.join()
+        # closing the process pool after computation
+        rasterization_pool.shutdown()
 
         # vrt to tif
         logging.info("Building VRT")
         vrt_options = gdal.BuildVRTOptions(resampleAlg='nearest')
 
-        def vrt_mosaic(tiles_glob, vrt_name, vrt_options, output):
+        # tiles written by write_dsm_by_tile() are prefixed with the hashes
+        # it returned, so that there is no need to scan the tmp directory
+        def vrt_mosaic(tiles_suffix, vrt_name, vrt_options, output):
             vrt_file = os.path.join(out_dir, vrt_name)
-            tiles_list = glob(os.path.join(out_dir, 'tmp', tiles_glob))
+            tiles_list = [os.path.join(tmp_dir, hashed_region + '_' + tiles_suffix)
+                          for hashed_region in delayed_dsm_tiles]
             vrt = gdal.BuildVRT(vrt_file, tiles_list, options=vrt_options)
             vrt = None
             ds = gdal.Open(vrt_file)
             ds = gdal.Translate(output, ds)
             ds = None
 
-        vrt_mosaic('*_dsm.tif', 'dsm.vrt', vrt_options, out_dsm)
-        vrt_mosaic('*_clr.tif', 'clr.vrt', vrt_options, out_clr)
+        mosaics = [('dsm.tif', 'dsm.vrt', vrt_options, out_dsm),
+                   ('clr.tif', 'clr.vrt', vrt_options, out_clr)]
 
         if output_stats:
-            vrt_mosaic('*_dsm_mean.tif', 'dsm_mean.vrt', vrt_options, out_dsm_mean)
-            vrt_mosaic('*_dsm_std.tif', 'dsm_std.vrt', vrt_options, out_dsm_std)
-            vrt_mosaic('*_dsm_n_pts.tif', 'dsm_n_pts.vrt', vrt_options, out_dsm_n_pts)
-            vrt_mosaic('*_pts_in_cell.tif', 'dsm_pts_in_cell.vrt', vrt_options, out_dsm_points_in_cell)
+            mosaics += [('dsm_mean.tif', 'dsm_mean.vrt', vrt_options, out_dsm_mean),
+                        ('dsm_std.tif', 'dsm_std.vrt', vrt_options, out_dsm_std),
+                        ('dsm_n_pts.tif', 'dsm_n_pts.vrt', vrt_options, out_dsm_n_pts),
+                        ('dsm_pts_in_cell.tif', 'dsm_pts_in_cell.vrt', vrt_options,
+                         out_dsm_points_in_cell)]
+
+        # Mosaics are independent, and GDAL releases the GIL during IO
+        with ThreadPoolExecutor(max_workers=len(mosaics)) as mosaic_pool:
+            list(mosaic_pool.map(lambda mosaic: vrt_mosaic(*mosaic), mosaics))
 
     # Fill output json file
     out_json[params.stereo_section_tag][params.stereo_output_section_tag][params.epsg_tag] = epsg
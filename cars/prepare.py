@@ -368,36 +368,35 @@ def run(
 
     # Matching tasks as delayed objects
     delayed_matches = []
-    for left_region in regions:
-        for offset in range(nb_splits):
-            offset_ = actual_range_start + offset * actual_region_size
-            # Pad region to include margins for right image
-            right_region = [left_region[0] + offset_,
-                            left_region[1],
-                            left_region[0] + offset_ + actual_region_size,
-                            left_region[3]]
-
-            # Pad with margin and crop to largest region
-            right_region = tiling.crop(tiling.pad(right_region, margins),
-                                       [0, 0, epipolar_size_x, epipolar_size_y])
-
-            # Avoid empty regions
-            if not tiling.empty(right_region):
-
-                delayed_matches.append(dask.delayed(matching_wrapper)(
-                    left_region,
-                    right_region,
-                    img1,
-                    img2,
-                    tmp1,
-                    tmp2,
-                    mask1,
-                    mask2,
-                    nodata1,
-                    nodata2,
-                    epipolar_size_x,
-                    epipolar_size_y))
-                
+    offsets = actual_range_start + np.arange(nb_splits) * actual_region_size
+    for left_region in regions.tolist():
+        # Right regions of all the disparity range splits at once
+        right_regions = np.empty((nb_splits, 4))
+        right_regions[:, 0] = left_region[0] + offsets
+        right_regions[:, 1] = left_region[1]
+        right_regions[:, 2] = left_region[0] + offsets + actual_region_size
+        right_regions[:, 3] = left_region[3]
+
+        # Pad with margin, crop to largest region and avoid empty regions
+        right_regions += [-margins[0], -margins[1], margins[2], margins[3]]
+        right_regions = tiling.crop_non_empty(right_regions,
+                                              [0, 0, epipolar_size_x, epipolar_size_y])
+
+        for right_region in right_regions.tolist():
+            delayed_matches.append(dask.delayed(matching_wrapper)(
+                left_region,
+                right_region,
+                img1,
+                img2,
+                tmp1,
+                tmp2,
+                mask1,
+                mask2,
+                nodata1,
+                nodata2,
+                epipolar_size_x,
+                epipolar_size_y))
+
     # Transform delayed tasks to future
     logging.info("Submitting {} tasks to dask".format(len(delayed_matches)))
     future_matches = client.compute(delayed_matches)
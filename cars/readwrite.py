@@ -26,6 +26,7 @@ This module contains all the reading/writing functions used in main.py
 # Standard imports
 import logging
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 # Third party imports
 import os
@@ -52,14 +53,32 @@ def compute_output_window(tile, full_bounds, resolution):
     :rtype: tuple(int, int, int, int)
     """
     x_min, y_min, x_max, y_max = full_bounds
-    x_0 = int((np.min(tile.coords["x"]) - x_min) / resolution - 0.5)
-    y_0 = int((y_max - np.max(tile.coords["y"])) / resolution - 0.5)
-    x_1 = int((np.max(tile.coords["x"]) - x_min) / resolution - 0.5)
-    y_1 = int((y_max - np.min(tile.coords["y"])) / resolution - 0.5)
+    # reduce raw coordinates arrays rather than xarray objects
+    tile_x = tile.coords["x"].values
+    tile_y = tile.coords["y"].values
+    x_0 = int((tile_x.min() - x_min) / resolution - 0.5)
+    y_0 = int((y_max - tile_y.max()) / resolution - 0.5)
+    x_1 = int((tile_x.max() - x_min) / resolution - 0.5)
+    y_1 = int((y_max - tile_y.min()) / resolution - 0.5)
 
     return (x_0, y_0, x_1, y_1)
 
 
+def contiguous_values(data_array, dtype):
+    """
+    Get the values of a data array as a C-contiguous array of a given type,
+    without copying them when they already are
+
+    :param data_array: data array to write
+    :type data_array: xarray.DataArray
+    :param dtype: type of the output raster
+    :type dtype: numpy dtype
+    :return: values of data_array
+    :rtype: np.ndarray
+    """
+    return np.ascontiguousarray(data_array.values, dtype=dtype)
+
+
 @contextmanager
 def rasterio_handles(names, files, params, nodata_values, nb_bands):
     """
@@ -122,19 +141,13 @@ def write_geotiff_dsm(future_dsm, output_dir, x_size, y_size, bounds,
     transform = Affine.from_gdal(*geotransform)
 
     # common parameters for rasterio output
-    dsm_rio_params = dict(
-        height=y_size, width=x_size, driver='GTiff', dtype=np.float32,
-        transform=transform, crs='EPSG:{}'.format(epsg), tiled=True
-    )
-    clr_rio_params = dict(
-        height=y_size, width=x_size, driver='GTiff', dtype=color_dtype,
-        transform=transform, crs='EPSG:{}'.format(epsg), tiled=True
-    )
-
-    dsm_rio_params_uint16 = dict(
-        height=y_size, width=x_size, driver='GTiff', dtype=np.uint16,
+    base_rio_params = dict(
+        height=y_size, width=x_size, driver='GTiff',
         transform=transform, crs='EPSG:{}'.format(epsg), tiled=True
     )
+    dsm_rio_params = {**base_rio_params, 'dtype': np.float32}
+    clr_rio_params = {**base_rio_params, 'dtype': color_dtype}
+    dsm_rio_params_uint16 = {**base_rio_params, 'dtype': np.uint16}
 
 
     dsm_file = os.path.join(output_dir, prefix+'dsm.tif')
@@ -188,8 +201,14 @@ def write_geotiff_dsm(future_dsm, output_dir, x_size, y_size, bounds,
             continue
         hasDatasets = hasDatasets and isinstance(tile, xr.Dataset)
 
-    # get file handle(s) with optional color file.
-    with rasterio_handles(names, files, params, nodata_values, nb_bands_to_write) as rio_handles:
+    # get file handle(s) with optional color file, and a pool of threads
+    # to write to them in parallel since rasterio releases the GIL during IO
+    with rasterio_handles(names, files, params, nodata_values, nb_bands_to_write) as rio_handles, \
+            ThreadPoolExecutor(max_workers=len(names)) as write_pool:
+
+        def write_band(name, data_array, window):
+            values = contiguous_values(data_array, rio_handles[name].dtypes[0])
+            return write_pool.submit(rio_handles[name].write_band, 1, values, window=window)
 
         # Use inner function for the writing of tiles
         def write(raster_tile):
@@ -210,16 +229,26 @@ def write_geotiff_dsm(future_dsm, output_dir, x_size, y_size, bounds,
             # window is speficied as origin & size
             window = rio.windows.Window(x0, y0, x1 - x0 + 1, y1 - y0 + 1)
 
-            rio_handles['dsm'].write_band(1, raster_tile['hgt'].values, window=window)
-            
+            writes = [write_band('dsm', raster_tile['hgt'], window)]
+
             if write_color:
-                rio_handles['clr'].write(raster_tile['img'].values.astype(color_dtype), window=window)
+                # colors are expected to be already cast by the rasterization
+                # workers, in which case no copy is made here
+                writes.append(write_pool.submit(
+                    rio_handles['clr'].write,
+                    contiguous_values(raster_tile['img'], color_dtype), window=window))
 
             if write_stats:
-                rio_handles['dsm_mean'].write_band(1, raster_tile['hgt_mean'].values, window=window)
-                rio_handles['dsm_std'].write_band(1, raster_tile['hgt_stdev'].values, window=window)
-                rio_handles['dsm_n_pts'].write_band(1, raster_tile['n_pts'].values, window=window)
-                rio_handles['dsm_pts_in_cell'].write_band(1, raster_tile['pts_in_cell'].values, window=window)
+                writes.append(write_band('dsm_mean', raster_tile['hgt_mean'], window))
+                writes.append(write_band('dsm_std', raster_tile['hgt_stdev'], window))
+                writes.append(write_band('dsm_n_pts', raster_tile['n_pts'], window))
+                writes.append(write_band('dsm_pts_in_cell', raster_tile['pts_in_cell'], window))
+
+            # wait for the whole tile to be written, raising write errors, so
+            # that each handle is only written by one thread at a time, as
+            # rasterio handles are not thread-safe
+            for pending_write in writes:
+                pending_write.result()
 
         # Multiprocessing mode
         if hasDatasets:
@@ -235,5 +264,7 @@ def write_geotiff_dsm(future_dsm, output_dir, x_size, y_size, bounds,
                 write(raster_tile)
 
                 logging.debug('Waiting for next tile')
+                # drop the reference to the written tile so that the
+                # scheduler can forget it, without a cancel request
                 if future is not None:
-                    future.cancel()
+                    future.release()
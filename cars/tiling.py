@@ -24,13 +24,68 @@ This module contains functions related to regions and tiles management
 """
 
 import math
+import numbers
+from functools import lru_cache
 import numpy as np
-from osgeo import osr
-from scipy import interpolate
-from cars import utils, projection
+from numba import njit, prange
+from shapely import wkb
+from cars import projection
 
 
-def grid(xmin, ymin, xmax, ymax, xsplit, ysplit):
+def _ceildiv(num, den):
+    """
+    Ceil of num / den, computed with integer arithmetic when both are integers
+
+    :param num: numerator
+    :type num: int or float
+    :param den: denominator
+    :type den: int or float
+    :returns: ceil(num / den)
+    :rtype: int
+    """
+    if isinstance(num, numbers.Integral) and isinstance(den, numbers.Integral):
+        return int(-(-num // den))
+
+    return math.ceil(num / den)
+
+
+def _representable_dtype(dtype, *values):
+    """
+    Check that positions computed from values, as integer steps from integer
+    bounds, are exactly representable with dtype
+
+    :param dtype: requested dtype, None for int64 if all values are integers
+        (as python integer inputs give python integer outputs) and float64
+        otherwise
+    :type dtype: np.dtype
+    :param values: bounds and steps the positions are computed from
+    :type values: float
+    :returns: dtype if the positions are exactly representable, float64 otherwise
+    :rtype: np.dtype
+    :raise ValueError: if dtype is neither float32, float64 nor int64
+    """
+    if dtype is None:
+        dtype = np.int64 if all(isinstance(value, numbers.Integral) for value in values) \
+            else np.float64
+    dtype = np.dtype(dtype)
+
+    # the compiled kernels only fill float32, float64 or int64 arrays
+    if dtype not in (np.float32, np.float64, np.int64):
+        raise ValueError('Unsupported dtype {}, use float32, float64 or int64'.format(dtype))
+
+    # float32 represents exactly integers up to 2**24 only
+    if dtype == np.float32 and not all(float(value).is_integer() and abs(value) <= 2**24
+                                       for value in values):
+        return np.dtype(np.float64)
+
+    # int64 represents positions computed from integers only
+    if dtype == np.int64 and not all(isinstance(value, numbers.Integral) for value in values):
+        return np.dtype(np.float64)
+
+    return dtype
+
+
+def grid(xmin, ymin, xmax, ymax, xsplit, ysplit, dtype=np.float64):
     """
     Generate grid of positions by splitting [xmin, xmax]x[ymin,ymax] in splits of xsplit x ysplit size
 
@@ -46,23 +101,44 @@ def grid(xmin, ymin, xmax, ymax, xsplit, ysplit):
     :type xsplit: int
     :param ysplit: height of splits
     :type ysplit: int
+    :param dtype: dtype of the output grid (float32, float64 or int64),
+        float64 is used instead if the positions are not exactly representable
+        with dtype
+    :type dtype: np.dtype
     :returns: A tuple with output grid, number of splits if first direction (n), number of splits in second direction (m)
     :type ndarray of shape (n+1,m+1,2)
     """
-    nb_xsplits = math.ceil((xmax - xmin) / xsplit)
-    nb_ysplits = math.ceil((ymax - ymin) / ysplit)
-
-    res = np.ndarray(shape=(nb_ysplits + 1, nb_xsplits + 1, 2), dtype=float)
+    nb_xsplits = _ceildiv(xmax - xmin, xsplit)
+    nb_ysplits = _ceildiv(ymax - ymin, ysplit)
 
-    for i in range(0, nb_xsplits + 1):
-        for j in range(0, nb_ysplits + 1):
-            res[j, i, 0] = min(xmax, xmin + i * xsplit)
-            res[j, i, 1] = min(ymax, ymin + j * ysplit)
+    res = np.empty((nb_ysplits + 1, nb_xsplits + 1, 2),
+                   dtype=_representable_dtype(dtype, xmin, ymin, xmax, ymax, xsplit, ysplit))
+    _grid(float(xmin), float(ymin), float(xmax), float(ymax),
+          float(xsplit), float(ysplit), nb_xsplits, nb_ysplits, res)
 
     return res
 
 
-def split(xmin, ymin, xmax, ymax, xsplit, ysplit):
+@njit(parallel=True, nogil=True, cache=True)
+def _grid(xmin, ymin, xmax, ymax, xsplit, ysplit, nb_xsplits, nb_ysplits, res):
+    """
+    Compiled kernel of grid, parallel over grid rows, filling res in place
+    """
+    # Positions along each axis, computed once
+    xs = np.empty(nb_xsplits + 1, dtype=np.float64)
+    for i in range(nb_xsplits + 1):
+        xs[i] = min(xmax, xmin + i * xsplit)
+    ys = np.empty(nb_ysplits + 1, dtype=np.float64)
+    for j in range(nb_ysplits + 1):
+        ys[j] = min(ymax, ymin + j * ysplit)
+
+    for j in prange(nb_ysplits + 1):
+        for i in range(nb_xsplits + 1):
+            res[j, i, 0] = xs[i]
+            res[j, i, 1] = ys[j]
+
+
+def split(xmin, ymin, xmax, ymax, xsplit, ysplit, dtype=None):
     """
     Split a region defined by [xmin, xmax]x[ymin,ymax] in splits of xsplit x ysplit size
 
@@ -78,27 +154,83 @@ def split(xmin, ymin, xmax, ymax, xsplit, ysplit):
     :type xsplit: int
     :param ysplit: height of splits
     :type ysplit: int
-    :returns: A list of splits represented by arrays of 4 elements [xmin, ymin, xmax, ymax]
-    :type list of 4 float
+    :param dtype: dtype of the output table (float32, float64 or int64),
+        float64 is used instead if the bounds are not exactly representable
+        with dtype. By default, int64 if all bounds and steps are integers and
+        float64 otherwise
+    :type dtype: np.dtype
+    :returns: A table of splits, one [xmin, ymin, xmax, ymax] row per split
+    :type np.ndarray of shape (N,4)
     """
-    nb_xsplits = math.ceil((xmax - xmin) / xsplit)
-    nb_ysplits = math.ceil((ymax - ymin) / ysplit)
+    nb_xsplits = _ceildiv(xmax - xmin, xsplit)
+    nb_ysplits = _ceildiv(ymax - ymin, ysplit)
 
-    terrain_regions = []
+    res = np.empty((nb_xsplits * nb_ysplits, 4),
+                   dtype=_representable_dtype(dtype, xmin, ymin, xmax, ymax, xsplit, ysplit))
+    _split(float(xmin), float(ymin), float(xmax), float(ymax),
+           float(xsplit), float(ysplit), nb_xsplits, nb_ysplits, res)
 
-    for i in range(0, nb_xsplits):
-        for j in range(0, nb_ysplits):
-            region = [xmin + i * xsplit,
-                      ymin + j * ysplit,
-                      xmin + (i + 1) * xsplit,
-                      ymin + (j + 1) * ysplit]
+    return res
 
-            # Crop to largest region
-            region = crop(region, [xmin, ymin, xmax, ymax])
 
-            terrain_regions.append(region)
+@njit(parallel=True, nogil=True, cache=True)
+def _split(xmin, ymin, xmax, ymax, xsplit, ysplit, nb_xsplits, nb_ysplits, res):
+    """
+    Compiled kernel of split, parallel over splits along x, filling res in place
+    """
+    # Split bounds along each axis, cropped to largest region, computed once
+    xs = np.empty(nb_xsplits + 1, dtype=np.float64)
+    for i in range(nb_xsplits + 1):
+        xs[i] = min(xmax, max(xmin, xmin + i * xsplit))
+    ys = np.empty(nb_ysplits + 1, dtype=np.float64)
+    for j in range(nb_ysplits + 1):
+        ys[j] = min(ymax, max(ymin, ymin + j * ysplit))
+
+    # Splits are ordered along y first then x
+    for i in prange(nb_xsplits):
+        for j in range(nb_ysplits):
+            k = i * nb_ysplits + j
+            res[k, 0] = xs[i]
+            res[k, 1] = ys[j]
+            res[k, 2] = xs[i + 1]
+            res[k, 3] = ys[j + 1]
+
+
+def iter_split(xmin, ymin, xmax, ymax, xsplit, ysplit):
+    """
+    Split a region defined by [xmin, xmax]x[ymin,ymax] in splits of xsplit x ysplit size,
+    yielding the splits one at a time in the same order as split
 
-    return terrain_regions
+    :param xmin : xmin of the bounding box of the region to split
+    :type xmin: float
+    :param ymin : ymin of the bounding box of the region to split
+    :type ymin: float
+    :param xmax : xmax of the bounding box of the region to split
+    :type xmax: float
+    :param ymax : ymax of the bounding box of the region to split
+    :type ymax: float
+    :param xsplit: width of splits
+    :type xsplit: int
+    :param ysplit: height of splits
+    :type ysplit: int
+    :returns: A generator of splits represented by arrays of 4 elements [xmin, ymin, xmax, ymax]
+    :type generator of list of 4 int (if all inputs are integers) or float
+    """
+    nb_xsplits = _ceildiv(xmax - xmin, xsplit)
+    nb_ysplits = _ceildiv(ymax - ymin, ysplit)
+
+    # Bounds are integers if all inputs are, as in split
+    values = (xmin, ymin, xmax, ymax, xsplit, ysplit)
+    cast = int if all(isinstance(value, numbers.Integral) for value in values) else float
+
+    # Split bounds along y, cropped to largest region, computed once
+    ys = [cast(min(ymax, max(ymin, ymin + j * ysplit))) for j in range(nb_ysplits + 1)]
+
+    for i in range(nb_xsplits):
+        split_xmin = cast(min(xmax, max(xmin, xmin + i * xsplit)))
+        split_xmax = cast(min(xmax, max(xmin, xmin + (i + 1) * xsplit)))
+        for j in range(nb_ysplits):
+            yield [split_xmin, ys[j], split_xmax, ys[j + 1]]
 
 
 def crop(region1, region2):
@@ -110,15 +242,49 @@ def crop(region1, region2):
     :param region2: The region used for cropping as an array [xmin, ymin, xmax, ymax]
     :type region2: list of four float
     :returns: The cropped regiona as an array [xmin, ymin, xmax, ymax]. If region1 is outside region2, might result in inconsistent region
-    :rtype: list of four float
+    :rtype: tuple of four float
     """
-    out = region1[:]
-    out[0] = min(region2[2], max(region2[0], region1[0]))
-    out[2] = min(region2[2], max(region2[0], region1[2]))
-    out[1] = min(region2[3], max(region2[1], region1[1]))
-    out[3] = min(region2[3], max(region2[1], region1[3]))
+    return (min(region2[2], max(region2[0], region1[0])),
+            min(region2[3], max(region2[1], region1[1])),
+            min(region2[2], max(region2[0], region1[2])),
+            min(region2[3], max(region2[1], region1[3])))
 
-    return out
+
+def crop_batch(regions, region2):
+    """
+    Crop a set of regions by another one
+
+    :param regions: The regions to crop as an array of [xmin, ymin, xmax, ymax] rows
+    :type regions: np.ndarray of shape (N,4)
+    :param region2: The region used for cropping as an array [xmin, ymin, xmax, ymax]
+    :type region2: list of four float
+    :returns: The cropped regions as an array of [xmin, ymin, xmax, ymax] rows. Regions outside
+        region2 might result in inconsistent regions
+    :rtype: np.ndarray of shape (N,4)
+    """
+    regions = np.asarray(regions)
+
+    return np.stack((np.clip(regions[:, 0], region2[0], region2[2]),
+                     np.clip(regions[:, 1], region2[1], region2[3]),
+                     np.clip(regions[:, 2], region2[0], region2[2]),
+                     np.clip(regions[:, 3], region2[1], region2[3])), axis=-1)
+
+
+def crop_non_empty(regions, region2):
+    """
+    Crop a set of regions by another one and drop the regions that end up empty
+
+    :param regions: The regions to crop as an array of [xmin, ymin, xmax, ymax] rows
+    :type regions: np.ndarray of shape (N,4)
+    :param region2: The region used for cropping as an array [xmin, ymin, xmax, ymax]
+    :type region2: list of four float
+    :returns: The non-empty cropped regions as an array of [xmin, ymin, xmax, ymax] rows
+    :rtype: np.ndarray of shape (M,4), M <= N
+    """
+    cropped = crop_batch(regions, region2)
+    mask = (cropped[:, 0] < cropped[:, 2]) & (cropped[:, 1] < cropped[:, 3])
+
+    return cropped[mask]
 
 
 def pad(region, margins):
@@ -130,15 +296,12 @@ def pad(region, margins):
     :param margins: Margin to add
     :type margins: list of four floats
     :returns: padded region
-    :rtype: list of four float
+    :rtype: tuple of four float
     """
-    out = region[:]
-    out[0] -= margins[0]
-    out[1] -= margins[1]
-    out[2] += margins[2]
-    out[3] += margins[3]
-
-    return out
+    return (region[0] - margins[0],
+            region[1] - margins[1],
+            region[2] + margins[2],
+            region[3] + margins[3])
 
 
 def empty(region):
@@ -158,67 +321,20 @@ def union(regions):
     Returns union of all regions
 
     :param regions: list of region as an array [xmin, ymin, xmax, ymax]
-    :type regions: list of list of four float
+    :type regions: list of list of four float or np.ndarray of shape (N,4)
     :returns: xmin, ymin, xmax, ymax
     :rtype: list of 4 float
     """
+    regions = np.asarray(regions).reshape(-1, 4)
 
-    xmin = min([r[0] for r in regions])
-    xmax = max([r[2] for r in regions])
-    ymin = min([r[1] for r in regions])
-    ymax = max([r[3] for r in regions])
+    xmin = regions[:, 0].min().item()
+    xmax = regions[:, 2].max().item()
+    ymin = regions[:, 1].min().item()
+    ymax = regions[:, 3].max().item()
 
     return xmin, ymin, xmax, ymax
 
 
-def list_tiles(region, largest_region, tile_size, margin=1):
-    """
-    Given a region, cut largest_region into tiles of size tile_size
-    and return tiles that intersect region within margin pixels.
-
-    :param region: The region to list intersecting tiles
-    :type region: list of four float
-    :param largest_region: The region to split
-    :type largest_region: list of four float
-    :param tile_size: Width of tiles for splitting (squared tiles)
-    :type tile_size: int
-    :param margin: Also include margin neighboring tiles
-    :type margin: int
-    :returns: A list of tiles as arrays of [xmin, ymin, xmax, ymax]
-    :rtype: list of 4 float
-    """
-    # Find tile indices covered by region
-    min_tile_idx_x = int(math.floor(region[0] / tile_size))
-    max_tile_idx_x = int(math.ceil(region[2] / tile_size))
-    min_tile_idx_y = int(math.floor(region[1] / tile_size))
-    max_tile_idx_y = int(math.ceil(region[3] / tile_size))
-
-    # Include additional tiles
-    min_tile_idx_x -= margin
-    min_tile_idx_y -= margin
-    max_tile_idx_x += margin
-    max_tile_idx_y += margin
-
-    out = []
-
-    # Loop on tile idx
-    for x in range(min_tile_idx_x, max_tile_idx_x):
-        for y in range(min_tile_idx_y, max_tile_idx_y):
-
-            # Derive tile coordinates
-            tile = [x * tile_size, y * tile_size,
-                    (x + 1) * tile_size, (y + 1) * tile_size]
-
-            # Crop to largest region
-            tile = crop(tile, largest_region)
-
-            # Check if tile is emtpy
-            if not empty(tile):
-                out.append(tile)
-
-    return out
-
-
 def roi_to_start_and_size(region, resolution):
     """
     Convert roi as array of [xmin, ymin, xmax, ymax] to xmin, ymin, xsize, ysize given a resolution
@@ -234,8 +350,8 @@ def roi_to_start_and_size(region, resolution):
     """
     xstart = region[0]
     ystart = region[3]
-    xsize = math.ceil((region[2] - region[0]) / resolution)
-    ysize = math.ceil((region[3] - region[1]) / resolution)
+    xsize = _ceildiv(region[2] - region[0], resolution)
+    ysize = _ceildiv(region[3] - region[1], resolution)
 
     return xstart, ystart, xsize, ysize
 
@@ -267,22 +383,28 @@ def ground_polygon_from_envelopes(
     """
     # project to the correct epsg if necessary
     if epsg1 != tgt_epsg:
-        poly_envelope1 = projection.polygon_projection(
-            poly_envelope1, epsg1, tgt_epsg)
+        poly_envelope1 = _project_polygon(poly_envelope1.wkb, epsg1, tgt_epsg)
 
     if epsg2 != tgt_epsg:
-        poly_envelope2 = projection.polygon_projection(
-            poly_envelope2, epsg2, tgt_epsg)
+        poly_envelope2 = _project_polygon(poly_envelope2.wkb, epsg2, tgt_epsg)
 
     # intersect both envelopes
-    if poly_envelope1.intersects(poly_envelope2):
-        inter = poly_envelope1.intersection(poly_envelope2)
-    else:
+    inter = poly_envelope1.intersection(poly_envelope2)
+    if inter.is_empty:
         raise Exception('The two envelopes do not intersect one another')
 
     return inter, inter.bounds
 
 
+@lru_cache(maxsize=128)
+def _project_polygon(poly_wkb, from_epsg, to_epsg):
+    """
+    Cached projection of a polygon, given as WKB so that equal polygons share
+    the same projection (see projection.polygon_projection)
+    """
+    return projection.polygon_projection(wkb.loads(poly_wkb), from_epsg, to_epsg)
+
+
 def snap_to_grid(xmin, ymin, xmax, ymax, resolution):
     """
     Given a roi as xmin, ymin, xmax, ymax, snap values to entire step
@@ -307,3 +429,24 @@ def snap_to_grid(xmin, ymin, xmax, ymax, resolution):
     ymax = math.ceil(ymax / resolution) * resolution
 
     return xmin, ymin, xmax, ymax
+
+
+def snap_to_grid_batch(regions, resolution):
+    """
+    Given regions as an array of [xmin, ymin, xmax, ymax] rows, snap values
+    to entire step of resolution (see snap_to_grid)
+
+    :param regions: regions to snap
+    :type regions: np.ndarray of shape (N,4)
+    :param resolution: size of cells for snapping
+    :type resolution: float
+    :returns: snapped regions as an array of [xmin, ymin, xmax, ymax] rows
+    :rtype: np.ndarray of shape (N,4)
+    """
+    regions = np.asarray(regions, dtype=np.float64)
+
+    out = np.empty_like(regions)
+    out[:, 0:2] = np.floor(regions[:, 0:2] / resolution) * resolution
+    out[:, 2:4] = np.ceil(regions[:, 2:4] / resolution) * resolution
+
+    return out
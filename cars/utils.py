@@ -358,11 +358,26 @@ def add_log_file(out_dir, command):
     :type out_dir: str
     :param command: command name which will be part of the log file name
     :type command: str
+    :returns: path of the log file
+    :rtype: str
     """
-    # set file log handler
     now = datetime.now()
-    h_log_file = logging.FileHandler(os.path.join(out_dir,
-                                                  '{}_{}.log'.format(now.strftime("%y-%m-%d_%Hh%Mm"), command)))
+    log_file = os.path.join(out_dir,
+                            '{}_{}.log'.format(now.strftime("%y-%m-%d_%Hh%Mm"), command))
+    add_log_file_handler(log_file)
+    return log_file
+
+
+def add_log_file_handler(log_file):
+    """
+    Add a file handler appending to log_file to the logger, at the current
+    logger level.
+
+    :param log_file: path of the log file
+    :type log_file: str
+    """
+    # set file log handler
+    h_log_file = logging.FileHandler(log_file)
     h_log_file.setLevel(logging.getLogger().getEffectiveLevel())
 
     formatter = logging.Formatter(fmt='%(asctime)s :: %(levelname)s :: %(message)s', datefmt='%y-%m-%d %H:%M:%S')
@@ -63,6 +63,8 @@ REQUIREMENTS = ['numpy>=1.17.0',
                 'tqdm',
                 'sphinx-rtd-theme',
                 'netCDF4==1.5.3',
+                'zarr<3',
+                'numcodecs',
                 'GitPython',
                 'argcomplete',
                 'Shapely',
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Copyright (c) 2020 Centre National d'Etudes Spatiales (CNES).
+#
+# This file is part of CARS
+# (see https://github.com/CNES/cars).
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+import numpy as np
+from scipy.spatial import Delaunay, cKDTree
+
+from cars import tiling
+from cars import compute_dsm
+
+
+def sheared_grid(rows, cols, shear, aspect):
+    """
+    Positions of points given in the frame of a regular grid, once the grid
+    is stretched along x by aspect and sheared along x by shear
+    """
+    return np.stack((10 + aspect * cols + shear * rows, 20 + rows), axis=-1)
+
+
+def random_grid_points(nb_rows, nb_cols, shear, aspect, nb_points):
+    """
+    Nodes of a sheared grid, flattened in row-major order, and random points
+    inside and outside of it
+    """
+    rows, cols = np.mgrid[0:nb_rows, 0:nb_cols]
+    grid_points = sheared_grid(rows.ravel().astype(np.float64),
+                               cols.ravel().astype(np.float64), shear, aspect)
+
+    rng = np.random.default_rng(0)
+    query_points = sheared_grid(rng.uniform(-1, nb_rows, nb_points),
+                                rng.uniform(-1, nb_cols, nb_points), shear, aspect)
+
+    return grid_points, query_points
+
+
+def assert_in_grid_triangles(grid_points, nb_cols, query_points, simplices, found):
+    """
+    Check that points are found in Delaunay triangles of the grid, that the
+    triangles containing them are halves of grid cells, and that points outside
+    of the grid fall back to their nearest node
+    """
+    # points are found in a triangle where Delaunay finds one
+    np.testing.assert_array_equal(found, Delaunay(grid_points).find_simplex(query_points) >= 0)
+    assert np.any(found) and not np.all(found)
+
+    # triangles are halves of grid cells: upper left node, then lower left or
+    # upper right node, then lower right node
+    upper_left = simplices[found, 0]
+    assert np.all((simplices[found, 1] == upper_left + nb_cols)
+                  | (simplices[found, 1] == upper_left + 1))
+    np.testing.assert_array_equal(simplices[found, 2], upper_left + nb_cols + 1)
+
+    # points are inside the triangles containing them
+    vertices = grid_points[simplices[found]]
+    edges = vertices[:, 1:] - vertices[:, :1]
+    offsets = query_points[found] - vertices[:, 0]
+    coords = np.linalg.solve(np.swapaxes(edges, 1, 2), offsets[..., np.newaxis])[..., 0]
+    assert np.all(coords >= -1e-9) and np.all(coords.sum(axis=-1) <= 1 + 1e-9)
+
+    # points outside of the grid fall back to their nearest node
+    nearest = cKDTree(grid_points).query(query_points[~found])[1]
+    np.testing.assert_array_equal(simplices[~found],
+                                  np.repeat(nearest[:, np.newaxis], 3, axis=-1))
+
+
+@pytest.mark.unit_tests
+@pytest.mark.parametrize("shear, aspect", [(0.3, 1), (0.8, 4), (2.0, 1), (-2.0, 0.25)])
+def test_locate_in_grid_triangles(shear, aspect):
+    """
+    Test locate_in_grid_triangles against scipy Delaunay triangulation, on
+    sheared and anisotropic grids
+    """
+    nb_rows, nb_cols = 8, 9
+    grid_points, query_points = random_grid_points(nb_rows, nb_cols, shear, aspect, 2000)
+
+    simplices, found = compute_dsm.locate_in_grid_triangles(
+        grid_points, (nb_rows, nb_cols), cKDTree(grid_points), query_points.reshape(100, 20, 2))
+    assert simplices.shape == (100, 20, 3)
+    assert found.shape == (100, 20)
+
+    assert_in_grid_triangles(grid_points, nb_cols, query_points,
+                             simplices.reshape(-1, 3), found.ravel())
+
+
+@pytest.mark.unit_tests
+def test_locate_in_grid_triangles_kernel():
+    """
+    Test the cell walk kernel of locate_in_grid_triangles from a far starting
+    node, on a strongly sheared grid
+    """
+    nb_rows, nb_cols = 8, 9
+    grid_points, query_points = random_grid_points(nb_rows, nb_cols, 2.0, 1, 2000)
+
+    # walks start from the first node instead of the nearest one
+    first_node = np.zeros(query_points.shape[0], dtype=np.int64)
+    simplices, found, resolved = compute_dsm._locate_in_grid_triangles(
+        grid_points, nb_rows, nb_cols, query_points, first_node)
+    assert np.all(resolved)
+
+    # points are found in the same triangles as from the nearest node,
+    # but fall back to the given node
+    nearest_simplices, nearest_found = compute_dsm.locate_in_grid_triangles(
+        grid_points, (nb_rows, nb_cols), cKDTree(grid_points), query_points)
+    np.testing.assert_array_equal(found, nearest_found)
+    np.testing.assert_array_equal(simplices[found], nearest_simplices[found])
+    assert np.all(simplices[~found] == 0)
+
+
+@pytest.mark.unit_tests
+def test_locate_in_grid_triangles_delaunay_fallback():
+    """
+    Test that points whose walk does not settle, in non-convex cells, are
+    located in a Delaunay triangulation
+    """
+    rows, cols = np.mgrid[0:3, 0:3]
+    grid_points = np.stack((cols.ravel(), rows.ravel()), axis=-1).astype(np.float64)
+    # move the center node so that the four cells are not convex
+    grid_points[4] = [0.3, 0.3]
+
+    rng = np.random.default_rng(0)
+    query_points = rng.uniform(-0.5, 2.5, (500, 2))
+
+    tree = cKDTree(grid_points)
+    _, _, resolved = compute_dsm._locate_in_grid_triangles(
+        grid_points, 3, 3, query_points, tree.query(query_points)[1].astype(np.int64))
+    assert not np.all(resolved)
+
+    delaunay = Delaunay(grid_points)
+    delaunay_simplices = delaunay.find_simplex(query_points)
+    simplices, found = compute_dsm.locate_in_grid_triangles(
+        grid_points, (3, 3), tree, query_points)
+    np.testing.assert_array_equal(found, delaunay_simplices >= 0)
+    np.testing.assert_array_equal(
+        simplices[~resolved], delaunay.simplices[delaunay_simplices[~resolved]])
+
+
+@pytest.mark.unit_tests
+def test_min_max_over_vertices():
+    """
+    Test min_max_over_vertices against numpy reductions
+    """
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-100, 100, (50, 3, 2))
+
+    coords_min, coords_max = compute_dsm.min_max_over_vertices(points)
+
+    np.testing.assert_array_equal(coords_min, np.min(points, axis=1))
+    np.testing.assert_array_equal(coords_max, np.max(points, axis=1))
+
+
+@pytest.mark.unit_tests
+def test_epipolar_tiles_regions():
+    """
+    Test epipolar_tiles_regions against tiling.crop and tiling.empty
+    """
+    rng = np.random.default_rng(0)
+    points_min = rng.uniform(-50, 150, (6, 7, 2))
+    points_max = points_min + rng.uniform(0, 20, (6, 7, 2))
+    largest_region = (0., 0., 100., 100.)
+
+    regions, empty = compute_dsm.epipolar_tiles_regions(
+        np.ascontiguousarray(points_min[..., 0]), np.ascontiguousarray(points_min[..., 1]),
+        np.ascontiguousarray(points_max[..., 0]), np.ascontiguousarray(points_max[..., 1]),
+        *largest_region)
+    assert regions.shape == (5, 6, 4)
+    assert empty.shape == (5, 6)
+
+    for j in range(5):
+        for i in range(6):
+            corners = np.concatenate((points_min[j:j+2, i:i+2].reshape(-1, 2),
+                                      points_max[j:j+2, i:i+2].reshape(-1, 2)))
+            expected_region = tiling.crop(
+                [*corners.min(axis=0), *corners.max(axis=0)], largest_region)
+            np.testing.assert_array_equal(regions[j, i], expected_region)
+            assert empty[j, i] == tiling.empty(expected_region)
+
+    # tiles outside of largest region are empty
+    regions, empty = compute_dsm.epipolar_tiles_regions(
+        np.ascontiguousarray(points_min[..., 0] + 500), np.ascontiguousarray(points_min[..., 1]),
+        np.ascontiguousarray(points_max[..., 0] + 500), np.ascontiguousarray(points_max[..., 1]),
+        *largest_region)
+    assert np.all(empty)
@@ -62,6 +62,22 @@ def test_compute_output_window():
     assert indices == (-316, 1656, -17, 1905)
 
 
+@pytest.mark.unit_tests
+def test_contiguous_values():
+    """
+    Test that values are only copied when their type or layout differ from the expected ones
+    """
+    values = np.arange(12, dtype=np.float32).reshape(3, 4)
+    data_array = xr.DataArray(values, dims=['y', 'x'])
+    assert np.shares_memory(readwrite.contiguous_values(data_array, np.float32), values)
+
+    data_array = xr.DataArray(values.T, dims=['x', 'y'])
+    out = readwrite.contiguous_values(data_array, np.uint16)
+    assert out.dtype == np.uint16
+    assert out.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(out, values.T)
+
+
 @pytest.mark.unit_tests
 def test_rasterio_handles():
     """
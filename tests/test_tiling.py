@@ -35,6 +35,13 @@ def test_grid():
     grid = tiling.grid(0, 0, 500, 400, 90, 90)
     assert grid.shape == (6, 7, 2)
 
+    grid_f32 = tiling.grid(0, 0, 500, 400, 90, 90, dtype=np.float32)
+    assert grid_f32.dtype == np.float32
+    np.testing.assert_array_equal(grid_f32, grid)
+
+    with pytest.raises(ValueError):
+        tiling.grid(0, 0, 500, 400, 90, 90, dtype=np.float16)
+
 
 @pytest.mark.unit_tests
 def test_split():
@@ -43,7 +50,36 @@ def test_split():
     """
     splits = tiling.split(0, 0, 500, 500, 100, 100)
     print(splits)
-    assert len(splits) == 25
+    assert splits.shape == (25, 4)
+
+    # Integer inputs give integer bounds, float inputs float bounds
+    assert splits.dtype == np.int64
+    assert tiling.split(0., 0, 500, 500, 100, 100).dtype == np.float64
+
+    splits = tiling.split(0, 0, 500, 500, 100, 100, dtype=np.float32)
+    assert splits.dtype == np.float32
+
+    # Fall back to float64 when bounds are not representable as float32
+    splits = tiling.split(0.5, 0, 500, 500, 100, 100, dtype=np.float32)
+    assert splits.dtype == np.float64
+
+    with pytest.raises(ValueError):
+        tiling.split(0, 0, 500, 500, 100, 100, dtype=np.int32)
+
+
+@pytest.mark.unit_tests
+def test_iter_split():
+    """
+    Test iter_split terrain method
+    """
+    splits = tiling.iter_split(0, 0, 500, 450, 100, 100)
+    assert not isinstance(splits, list)
+    splits = list(splits)
+    assert splits == tiling.split(0, 0, 500, 450, 100, 100).tolist()
+    assert all(isinstance(value, int) for value in splits[0])
+
+    splits = list(tiling.iter_split(0.5, 0, 500, 450, 100, 100))
+    assert splits == tiling.split(0.5, 0, 500, 450, 100, 100).tolist()
 
 
 @pytest.mark.unit_tests
@@ -56,7 +92,36 @@ def test_crop():
 
     cropped = tiling.crop(region1, region2)
 
-    assert cropped == [50, 0, 100, 80]
+    assert cropped == (50, 0, 100, 80)
+
+
+@pytest.mark.unit_tests
+def test_crop_batch():
+    """
+    Test crop_batch function
+    """
+    regions = np.array([[0, 0, 100, 100], [50, -10, 70, 20], [130, 0, 150, 80]])
+    region2 = [50, 0, 120, 80]
+
+    cropped = tiling.crop_batch(regions, region2)
+
+    np.testing.assert_array_equal(cropped, [[50, 0, 100, 80],
+                                            [50, 0, 70, 20],
+                                            [120, 0, 120, 80]])
+    assert tuple(cropped[0]) == tiling.crop([0, 0, 100, 100], region2)
+
+
+@pytest.mark.unit_tests
+def test_crop_non_empty():
+    """
+    Test crop_non_empty function
+    """
+    regions = np.array([[0, 0, 100, 100], [130, 0, 150, 80], [60, 10, 70, 10]])
+    region2 = [50, 0, 120, 80]
+
+    cropped = tiling.crop_non_empty(regions, region2)
+
+    np.testing.assert_array_equal(cropped, [[50, 0, 100, 80]])
 
 
 @pytest.mark.unit_tests
@@ -68,7 +133,7 @@ def test_pad():
     region = [1, 2, 3, 4]
     margin = [5, 6, 7, 8]
 
-    assert tiling.pad(region, margin) == [-4, -4, 10, 12]
+    assert tiling.pad(region, margin) == (-4, -4, 10, 12)
 
 
 @pytest.mark.unit_tests
@@ -88,42 +153,7 @@ def test_union():
     Test union function
     """
     assert tiling.union([[0, 0, 5, 6], [2, 3, 10, 11]]) == (0, 0, 10, 11)
-
-
-@pytest.mark.unit_tests
-def test_list_tiles():
-    """
-    Test list_tiles function
-    """
-    region = [45, 65, 55, 75]
-    largest_region = [0, 0, 100, 100]
-    tile_size = 10
-
-    tiles = tiling.list_tiles(region, largest_region, tile_size, margin=0)
-
-    assert tiles == [[40, 60, 50, 70], [40, 70, 50, 80],
-                     [50, 60, 60, 70], [50, 70, 60, 80]]
-
-    tiles = tiling.list_tiles(region, largest_region, tile_size, margin=1)
-
-    assert tiles == [
-        [
-            30, 50, 40, 60], [
-            30, 60, 40, 70], [
-                30, 70, 40, 80], [
-                    30, 80, 40, 90], [
-                        40, 50, 50, 60], [
-                            40, 60, 50, 70], [
-                                40, 70, 50, 80], [
-                                    40, 80, 50, 90], [
-                                        50, 50, 60, 60], [
-                                            50, 60, 60, 70], [
-                                                50, 70, 60, 80], [
-                                                    50, 80, 60, 90], [
-                                                        60, 50, 70, 60], [
-                                                            60, 60, 70, 70], [
-                                                                60, 70, 70, 80], [
-                                                                    60, 80, 70, 90]]
+    assert tiling.union(np.array([[0., 0., 5., 6.], [2., 3., 10., 11.]])) == (0, 0, 10, 11)
 
 
 @pytest.mark.unit_tests
@@ -143,6 +173,20 @@ def test_snap_to_grid():
     """
     assert (0, 0, 11, 11) == tiling.snap_to_grid(0.1, 0.2, 10.1, 10.2, 1.)
 
+    # integer inputs and resolution give integers back
+    assert all(isinstance(value, int) for value in tiling.snap_to_grid(1, 2, 11, 12, 5))
+
+
+@pytest.mark.unit_tests
+def test_snap_to_grid_batch():
+    """
+    Test snap_to_grid_batch function
+    """
+    regions = np.array([[0.1, 0.2, 10.1, 10.2], [-0.1, 0.2, 10.1, 10.2]])
+
+    np.testing.assert_array_equal(tiling.snap_to_grid_batch(regions, 0.5),
+                                  [[0, 0, 10.5, 10.5], [-0.5, 0, 10.5, 10.5]])
+
 
 @pytest.mark.unit_tests
 def test_ground_positions_from_envelopes():